@@ -7,6 +7,8 @@ import networkx as nx
 import csv
 import copy
 import json
+import collections
+import io
 
 import sys
 csv.field_size_limit(sys.maxsize)
@@ -28,11 +30,17 @@ except ImportError:
 from . import utils
 
 import numpy as np
+import scipy.sparse
 from psycopg2.extensions import register_adapter, AsIs
 
 register_adapter(np.float64, AsIs)
+register_adapter(np.float32, AsIs)
 register_adapter(np.int64, AsIs)
+register_adapter(np.int32, AsIs)
 sqlite3.register_adapter(np.int64, int)
+sqlite3.register_adapter(np.int32, int)
+sqlite3.register_adapter(np.float64, float)
+sqlite3.register_adapter(np.float32, float)
 
 class Database(object):
 	'''
@@ -40,10 +48,25 @@ class Database(object):
 	Network objects are not sufficient, especially because of their dynamical properties.
 
 	By default SQLite is used, but PostgreSQL is also an option
+
+	With temporal_snapshots=True, snapshots are not materialized in snapshot_data but served by range queries on the temporal_edges table.
+	The option should be kept consistent for a given database, snapshots built in one mode do not have their edges stored for the other one.
+
+	Edge and node arrays of the network_cache_size last used snapshots are kept in memory (see get_network_arrays).
+
+	connection_params holds the arguments needed to open another connection to the same database, e.g. from worker processes.
+	init_tables=False skips init_db, for connections to an already initialized database.
 	'''
 
-	def __init__(self,db_type='sqlite',db_name='depsysif',db_folder='.',db_user='postgres',port='5432',host='localhost',password=None,clean_first=False):
+	def __init__(self,db_type='sqlite',db_name='depsysif',db_folder='.',db_user='postgres',port='5432',host='localhost',password=None,clean_first=False,temporal_snapshots=False,network_cache_size=8,init_tables=True):
 		self.db_type = db_type
+		self.temporal_snapshots = temporal_snapshots
+		self.network_cache_size = network_cache_size
+		self.network_cache = collections.OrderedDict()
+		self.cache_hits = 0
+		self.cache_misses = 0
+		self.cfg_ids = {}
+		self.connection_params = {'db_type':db_type,'db_name':db_name,'db_folder':db_folder,'db_user':db_user,'port':port,'host':host,'password':password,'temporal_snapshots':temporal_snapshots,'network_cache_size':network_cache_size}
 		if db_type == 'sqlite':
 			if db_name.startswith(':memory:'):
 				self.connection = sqlite3.connect(db_name)
@@ -65,7 +88,8 @@ class Database(object):
 
 		if clean_first:
 			self.clean_db()
-		self.init_db()
+		if init_tables or clean_first:
+			self.init_db()
 
 	def init_db(self):
 		'''
@@ -91,6 +115,7 @@ class Database(object):
 				);
 
 				CREATE INDEX IF NOT EXISTS versions_date ON versions(project_id,created_at);
+				CREATE INDEX IF NOT EXISTS versions_time ON versions(created_at);
 
 				CREATE TABLE IF NOT EXISTS dependencies(
 				version_id INTEGER REFERENCES versions(id) ON DELETE CASCADE,
@@ -120,25 +145,48 @@ class Database(object):
 
 				CREATE INDEX IF NOT EXISTS snapdat_used ON snapshot_data(snapshot_id,project_used,project_using);
 
+				CREATE TABLE IF NOT EXISTS temporal_edges(
+				project_using INTEGER REFERENCES projects(id) ON DELETE CASCADE,
+				project_used INTEGER REFERENCES projects(id) ON DELETE CASCADE,
+				full_network BOOLEAN NOT NULL,
+				valid_from DATE NOT NULL,
+				valid_to DATE,
+				PRIMARY KEY(full_network,project_using,project_used,valid_from)
+				);
+
+				CREATE INDEX IF NOT EXISTS tempedges_time ON temporal_edges(full_network,valid_from,valid_to);
+
+				CREATE VIEW IF NOT EXISTS temporal_snapshot_data AS
+					SELECT s.id AS snapshot_id,te.project_using,te.project_used FROM snapshots s
+						INNER JOIN temporal_edges te
+							ON te.full_network=s.full_network
+							AND te.valid_from<=s.snapshot_time
+							AND (te.valid_to IS NULL OR te.valid_to>s.snapshot_time);
+
+				CREATE TABLE IF NOT EXISTS sim_configs(
+				id INTEGER PRIMARY KEY,
+				cfg TEXT UNIQUE NOT NULL
+				);
+
 				CREATE TABLE IF NOT EXISTS simulations(
 				id INTEGER PRIMARY KEY,
 				snapshot_id INTEGER REFERENCES snapshots(id) ON DELETE CASCADE,
 				created_at DATE DEFAULT CURRENT_TIMESTAMP,
-				sim_cfg TEXT,
+				sim_cfg_id INTEGER REFERENCES sim_configs(id) ON DELETE CASCADE,
 				random_seed INTEGER,
 				executed BOOLEAN DEFAULT false,
 				failing_project INTEGER REFERENCES projects(id) ON DELETE CASCADE,
-				UNIQUE(snapshot_id,sim_cfg,random_seed,failing_project)
+				UNIQUE(snapshot_id,sim_cfg_id,random_seed,failing_project)
 				);
 
-				-- CREATE INDEX IF NOT EXISTS sim_algocfg ON simulations(sim_cfg);
+				-- CREATE INDEX IF NOT EXISTS sim_algocfg ON simulations(sim_cfg_id);
 				-- CREATE INDEX IF NOT EXISTS sim_time ON simulations(created_at);
 				-- CREATE INDEX IF NOT EXISTS sim_snapid ON simulations(snapshot_id);
 				-- CREATE INDEX IF NOT EXISTS sim_seed ON simulations(snapshot_id,random_seed);
 				-- CREATE INDEX IF NOT EXISTS sim_exec ON simulations(snapshot_id,executed);
 				-- CREATE INDEX IF NOT EXISTS sim_proj ON simulations(failing_project);
 				-- CREATE INDEX IF NOT EXISTS sim_snapid_proj ON simulations(snapshot_id,failing_project);
-				CREATE INDEX IF NOT EXISTS sim_extended_idx ON simulations(snapshot_id,sim_cfg,failing_project,executed,id);
+				CREATE INDEX IF NOT EXISTS sim_extended_idx ON simulations(snapshot_id,sim_cfg_id,failing_project,executed,id);
 
 				CREATE TABLE IF NOT EXISTS simulation_results(
 				simulation_id INTEGER REFERENCES simulations(id) ON DELETE CASCADE,
@@ -146,6 +194,24 @@ class Database(object):
 				PRIMARY KEY(simulation_id,failing)
 				);
 
+				CREATE TABLE IF NOT EXISTS sim_agg(
+				snapshot_id INTEGER REFERENCES snapshots(id) ON DELETE CASCADE,
+				sim_cfg_id INTEGER REFERENCES sim_configs(id) ON DELETE CASCADE,
+				failing_project INTEGER REFERENCES projects(id) ON DELETE CASCADE,
+				nb_runs INTEGER NOT NULL DEFAULT 0,
+				sum_failing INTEGER NOT NULL DEFAULT 0,
+				PRIMARY KEY(snapshot_id,sim_cfg_id,failing_project)
+				);
+
+				CREATE TABLE IF NOT EXISTS sim_agg_failing(
+				snapshot_id INTEGER REFERENCES snapshots(id) ON DELETE CASCADE,
+				sim_cfg_id INTEGER REFERENCES sim_configs(id) ON DELETE CASCADE,
+				failing_project INTEGER REFERENCES projects(id) ON DELETE CASCADE,
+				failing INTEGER REFERENCES projects(id) ON DELETE CASCADE,
+				nb_failing INTEGER NOT NULL DEFAULT 0,
+				PRIMARY KEY(snapshot_id,sim_cfg_id,failing_project,failing)
+				);
+
 
 				CREATE TABLE IF NOT EXISTS deleted_dependencies(
 				project_using INTEGER REFERENCES projects(id) ON DELETE CASCADE,
@@ -161,8 +227,8 @@ class Database(object):
 				CREATE TABLE IF NOT EXISTS measure_types(
 				id INTEGER PRIMARY KEY,
 				name TEXT,
-				cfg TEXT,
-				UNIQUE(name,cfg)
+				cfg_id INTEGER REFERENCES sim_configs(id) ON DELETE CASCADE,
+				UNIQUE(name,cfg_id)
 				);
 
 				CREATE TABLE IF NOT EXISTS computed_measures(
@@ -185,8 +251,8 @@ class Database(object):
 				CREATE TABLE IF NOT EXISTS exact_computation(
 				id INTEGER PRIMARY KEY,
 				snapshot_id INTEGER REFERENCES snapshots(id) ON DELETE CASCADE,
-				cfg TEXT,
-				UNIQUE(snapshot_id,cfg)
+				cfg_id INTEGER REFERENCES sim_configs(id) ON DELETE CASCADE,
+				UNIQUE(snapshot_id,cfg_id)
 				);
 
 
@@ -202,6 +268,7 @@ class Database(object):
 			for q in DB_INIT.split(';')[:-1]:
 				self.cursor.execute(q)
 			self.connection.commit()
+			self.migrate_timestamps()
 		elif self.db_type == 'postgres':
 			self.cursor.execute('''
 				CREATE TABLE IF NOT EXISTS projects(
@@ -221,6 +288,7 @@ class Database(object):
 				);
 
 				CREATE INDEX IF NOT EXISTS versions_date ON versions(project_id,created_at);
+				CREATE INDEX IF NOT EXISTS versions_time ON versions(created_at);
 
 				CREATE TABLE IF NOT EXISTS dependencies(
 				version_id BIGINT REFERENCES versions(id) ON DELETE CASCADE,
@@ -251,25 +319,48 @@ class Database(object):
 
 				CREATE INDEX IF NOT EXISTS snapdat_used ON snapshot_data(snapshot_id,project_used,project_using);
 
+				CREATE TABLE IF NOT EXISTS temporal_edges(
+				project_using BIGINT REFERENCES projects(id) ON DELETE CASCADE,
+				project_used BIGINT REFERENCES projects(id) ON DELETE CASCADE,
+				full_network BOOLEAN NOT NULL,
+				valid_from TIMESTAMP NOT NULL,
+				valid_to TIMESTAMP,
+				PRIMARY KEY(full_network,project_using,project_used,valid_from)
+				);
+
+				CREATE INDEX IF NOT EXISTS tempedges_time ON temporal_edges(full_network,valid_from,valid_to);
+
+				CREATE OR REPLACE VIEW temporal_snapshot_data AS
+					SELECT s.id AS snapshot_id,te.project_using,te.project_used FROM snapshots s
+						INNER JOIN temporal_edges te
+							ON te.full_network=s.full_network
+							AND te.valid_from<=s.snapshot_time
+							AND (te.valid_to IS NULL OR te.valid_to>s.snapshot_time);
+
+				CREATE TABLE IF NOT EXISTS sim_configs(
+				id BIGSERIAL PRIMARY KEY,
+				cfg JSONB UNIQUE NOT NULL
+				);
+
 				CREATE TABLE IF NOT EXISTS simulations(
 				id BIGSERIAL PRIMARY KEY,
 				snapshot_id BIGINT REFERENCES snapshots(id) ON DELETE CASCADE,
 				created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-				sim_cfg JSONB,
+				sim_cfg_id BIGINT REFERENCES sim_configs(id) ON DELETE CASCADE,
 				random_seed BIGINT,
 				executed BOOLEAN DEFAULT false,
 				failing_project BIGINT REFERENCES projects(id) ON DELETE CASCADE,
-				UNIQUE(snapshot_id,sim_cfg,random_seed,failing_project)
+				UNIQUE(snapshot_id,sim_cfg_id,random_seed,failing_project)
 				);
 
-				-- CREATE INDEX IF NOT EXISTS sim_algocfg ON simulations USING GIN(sim_cfg);
+				-- CREATE INDEX IF NOT EXISTS sim_algocfg ON simulations(sim_cfg_id);
 				-- CREATE INDEX IF NOT EXISTS sim_time ON simulations(created_at);
 				-- CREATE INDEX IF NOT EXISTS sim_snapid ON simulations(snapshot_id);
 				-- CREATE INDEX IF NOT EXISTS sim_seed ON simulations(snapshot_id,random_seed);
 				-- CREATE INDEX IF NOT EXISTS sim_exec ON simulations(snapshot_id,executed);
 				-- CREATE INDEX IF NOT EXISTS sim_proj ON simulations(failing_project);
 				-- CREATE INDEX IF NOT EXISTS sim_snapid_proj ON simulations(snapshot_id,failing_project);
-				CREATE INDEX IF NOT EXISTS sim_extended_idx ON simulations(snapshot_id,sim_cfg,failing_project,executed,id);
+				CREATE INDEX IF NOT EXISTS sim_extended_idx ON simulations(snapshot_id,sim_cfg_id,failing_project,executed,id);
 
 				CREATE TABLE IF NOT EXISTS simulation_results(
 				simulation_id BIGINT REFERENCES simulations(id) ON DELETE CASCADE,
@@ -277,6 +368,24 @@ class Database(object):
 				PRIMARY KEY(simulation_id,failing)
 				);
 
+				CREATE TABLE IF NOT EXISTS sim_agg(
+				snapshot_id BIGINT REFERENCES snapshots(id) ON DELETE CASCADE,
+				sim_cfg_id BIGINT REFERENCES sim_configs(id) ON DELETE CASCADE,
+				failing_project BIGINT REFERENCES projects(id) ON DELETE CASCADE,
+				nb_runs BIGINT NOT NULL DEFAULT 0,
+				sum_failing BIGINT NOT NULL DEFAULT 0,
+				PRIMARY KEY(snapshot_id,sim_cfg_id,failing_project)
+				);
+
+				CREATE TABLE IF NOT EXISTS sim_agg_failing(
+				snapshot_id BIGINT REFERENCES snapshots(id) ON DELETE CASCADE,
+				sim_cfg_id BIGINT REFERENCES sim_configs(id) ON DELETE CASCADE,
+				failing_project BIGINT REFERENCES projects(id) ON DELETE CASCADE,
+				failing BIGINT REFERENCES projects(id) ON DELETE CASCADE,
+				nb_failing BIGINT NOT NULL DEFAULT 0,
+				PRIMARY KEY(snapshot_id,sim_cfg_id,failing_project,failing)
+				);
+
 				CREATE TABLE IF NOT EXISTS deleted_dependencies(
 				project_using BIGINT REFERENCES projects(id) ON DELETE CASCADE,
 				project_used BIGINT REFERENCES projects(id) ON DELETE CASCADE,
@@ -291,8 +400,8 @@ class Database(object):
 				CREATE TABLE IF NOT EXISTS measure_types(
 				id BIGSERIAL PRIMARY KEY,
 				name TEXT,
-				cfg JSONB,
-				UNIQUE(name,cfg)
+				cfg_id BIGINT REFERENCES sim_configs(id) ON DELETE CASCADE,
+				UNIQUE(name,cfg_id)
 				);
 
 				CREATE TABLE IF NOT EXISTS computed_measures(
@@ -315,8 +424,8 @@ class Database(object):
 				CREATE TABLE IF NOT EXISTS exact_computation(
 				id BIGSERIAL PRIMARY KEY,
 				snapshot_id BIGINT REFERENCES snapshots(id) ON DELETE CASCADE,
-				cfg JSONB,
-				UNIQUE(snapshot_id,cfg)
+				cfg_id BIGINT REFERENCES sim_configs(id) ON DELETE CASCADE,
+				UNIQUE(snapshot_id,cfg_id)
 				);
 
 
@@ -332,6 +441,26 @@ class Database(object):
 
 			self.connection.commit()
 
+	def migrate_timestamps(self):
+		'''
+		SQLite only: converts timestamps stored in other formats (dates without time, ISO with T separator or timezone, microseconds)
+		to the canonical form 'YYYY-MM-DD HH:MM:SS', which is used on ingest since schema version 1 (PRAGMA user_version).
+		Time filters are then plain comparisons on the indexed columns, without wrapping them in DATETIME().
+		'''
+		if self.db_type != 'sqlite':
+			return
+		self.cursor.execute('PRAGMA user_version;')
+		if self.cursor.fetchone()[0] >= 1:
+			return
+		logger.info('Migrating timestamps to canonical format')
+		for table,column in [('projects','created_at'),('versions','created_at'),('snapshots','snapshot_time'),('temporal_edges','valid_from'),('temporal_edges','valid_to')]:
+			self.cursor.execute('''UPDATE {table} SET {column}=DATETIME({column})
+						WHERE {column} IS NOT DATETIME({column}) AND DATETIME({column}) IS NOT NULL
+					;'''.format(table=table,column=column))
+		self.cursor.execute('PRAGMA user_version=1;')
+		self.connection.commit()
+		logger.info('Migrated timestamps')
+
 	def move_to_ram(self):
 		'''
 		For sqlite DBs, when doing extensive inserts etc (run_simulations for example), may be useful.
@@ -371,19 +500,33 @@ class Database(object):
 			logger.info('Retrieved DB from RAM')
 
 
+	def can_reconnect(self):
+		'''
+		Whether other processes can open their own connection to the same database using connection_params.
+		Not the case for in-memory SQLite databases, including ones moved to RAM with move_to_ram.
+		'''
+		return not (self.db_type == 'sqlite' and self.in_ram)
+
 	def clean_db(self):
 		'''
 		Dropping tables
 		If there is a change in structure in the init script, this method should be called to 'reset' the state of the database
 		'''
 		logger.info('Cleaning database')
+		self.clear_network_cache()
+		self.cfg_ids = {}
 		self.cursor.execute('DROP TABLE IF EXISTS exact_computation_values;')
 		self.cursor.execute('DROP TABLE IF EXISTS exact_computation;')
 		self.cursor.execute('DROP TABLE IF EXISTS measures;')
 		self.cursor.execute('DROP TABLE IF EXISTS computed_measures;')
 		self.cursor.execute('DROP TABLE IF EXISTS measure_types;')
+		self.cursor.execute('DROP TABLE IF EXISTS sim_agg_failing;')
+		self.cursor.execute('DROP TABLE IF EXISTS sim_agg;')
 		self.cursor.execute('DROP TABLE IF EXISTS simulation_results;')
 		self.cursor.execute('DROP TABLE IF EXISTS simulations;')
+		self.cursor.execute('DROP TABLE IF EXISTS sim_configs;')
+		self.cursor.execute('DROP VIEW IF EXISTS temporal_snapshot_data;')
+		self.cursor.execute('DROP TABLE IF EXISTS temporal_edges;')
 		self.cursor.execute('DROP TABLE IF EXISTS snapshot_data;')
 		self.cursor.execute('DROP TABLE IF EXISTS snapshots;')
 		self.cursor.execute('DROP TABLE IF EXISTS dependencies;')
@@ -393,6 +536,8 @@ class Database(object):
 		self.connection.commit()
 
 	def remove_results(self):
+		self.cursor.execute('DELETE FROM sim_agg_failing CASCADE;')
+		self.cursor.execute('DELETE FROM sim_agg CASCADE;')
 		self.cursor.execute('DELETE FROM simulation_results CASCADE;')
 		self.cursor.execute('DELETE FROM simulations CASCADE;')
 		self.connection.commit()
@@ -401,6 +546,7 @@ class Database(object):
 		self.cursor.execute('DELETE FROM snapshot_data CASCADE;')
 		self.cursor.execute('DELETE FROM snapshots CASCADE;')
 		self.connection.commit()
+		self.clear_network_cache()
 
 	def remove_exact_comp(self):
 		self.cursor.execute('DELETE FROM exact_computation CASCADE;')
@@ -429,7 +575,7 @@ class Database(object):
 		'''
 		checking if a table is empty, result as a boolean
 		'''
-		if table not in ['projects','dependencies','versions','snapshots','snapshot_data']:
+		if table not in ['projects','dependencies','versions','snapshots','snapshot_data','temporal_edges']:
 			raise ValueError('Not valid table name: {}'.format(table))
 		else:
 			self.cursor.execute('SELECT * FROM {} LIMIT 1;'.format(table))
@@ -468,7 +614,7 @@ class Database(object):
 			if self.db_type == 'postgres':
 				extras.execute_batch(self.cursor,'INSERT INTO projects(id,name,created_at) VALUES(%s,%s,%s) ON CONFLICT DO NOTHING;',cratesdb_cursor.fetchall())
 			else:
-				self.cursor.executemany('INSERT OR IGNORE INTO projects(id,name,created_at) VALUES(?,?,?);',cratesdb_cursor.fetchall())
+				self.cursor.executemany('INSERT OR IGNORE INTO projects(id,name,created_at) VALUES(?,?,DATETIME(?));',cratesdb_cursor.fetchall())
 			self.connection.commit()
 			logger.info('Filled projects')
 
@@ -482,7 +628,7 @@ class Database(object):
 			if self.db_type == 'postgres':
 				extras.execute_batch(self.cursor,'INSERT INTO versions(id,name,project_id,created_at) VALUES(%s,%s,%s,%s) ON CONFLICT DO NOTHING;',cratesdb_cursor.fetchall())
 			else:
-				self.cursor.executemany('INSERT OR IGNORE INTO versions(id,name,project_id,created_at) VALUES(?,?,?,?);',cratesdb_cursor.fetchall())
+				self.cursor.executemany('INSERT OR IGNORE INTO versions(id,name,project_id,created_at) VALUES(?,?,?,DATETIME(?));',cratesdb_cursor.fetchall())
 
 			self.connection.commit()
 			logger.info('Filled versions')
@@ -554,7 +700,7 @@ class Database(object):
 			if self.db_type == 'postgres':
 				extras.execute_batch(self.cursor,'INSERT INTO projects(id,name,created_at) VALUES(%s,%s,%s) ON CONFLICT DO NOTHING;',libio_cursor.fetchall())
 			else:
-				self.cursor.executemany('INSERT OR IGNORE INTO projects(id,name,created_at) VALUES(?,?,?);',libio_cursor.fetchall())
+				self.cursor.executemany('INSERT OR IGNORE INTO projects(id,name,created_at) VALUES(?,?,DATETIME(?));',libio_cursor.fetchall())
 			self.connection.commit()
 			logger.info('Filled projects')
 
@@ -569,7 +715,7 @@ class Database(object):
 			if self.db_type == 'postgres':
 				extras.execute_batch(self.cursor,'INSERT INTO versions(id,name,project_id,created_at) VALUES(%s,%s,%s,%s) ON CONFLICT DO NOTHING;',libio_cursor.fetchall())
 			else:
-				self.cursor.executemany('INSERT OR IGNORE INTO versions(id,name,project_id,created_at) VALUES(?,?,?,?);',libio_cursor.fetchall())
+				self.cursor.executemany('INSERT OR IGNORE INTO versions(id,name,project_id,created_at) VALUES(?,?,?,DATETIME(?));',libio_cursor.fetchall())
 
 			self.connection.commit()
 			logger.info('Filled versions')
@@ -674,7 +820,7 @@ class Database(object):
 				if self.db_type == 'postgres':
 					extras.execute_batch(self.cursor,'INSERT INTO projects(id,name,created_at) VALUES(%s,%s,%s) ON CONFLICT DO NOTHING;',(r for r in reader))
 				else:
-					self.cursor.executemany('INSERT OR IGNORE INTO projects(id,name,created_at) VALUES(?,?,?);',(r for r in reader))
+					self.cursor.executemany('INSERT OR IGNORE INTO projects(id,name,created_at) VALUES(?,?,DATETIME(?));',(r for r in reader))
 				self.connection.commit()
 			logger.info('Filled projects')
 
@@ -692,7 +838,7 @@ class Database(object):
 				if self.db_type == 'postgres':
 					extras.execute_batch(self.cursor,'INSERT INTO versions(id,name,project_id,created_at) VALUES(%s,%s,%s,%s) ON CONFLICT DO NOTHING;',reader)
 				else:
-					self.cursor.executemany('INSERT OR IGNORE INTO versions(id,name,project_id,created_at) VALUES(?,?,?,?);',reader)
+					self.cursor.executemany('INSERT OR IGNORE INTO versions(id,name,project_id,created_at) VALUES(?,?,?,DATETIME(?));',reader)
 
 				self.connection.commit()
 			logger.info('Filled versions')
@@ -744,7 +890,7 @@ class Database(object):
 				if self.db_type == 'postgres':
 					extras.execute_batch(self.cursor,'INSERT INTO projects(name,created_at) VALUES(%s,%s) ON CONFLICT DO NOTHING;',((r[0],r[2]) for r in reader))
 				else:
-					self.cursor.executemany('INSERT OR IGNORE INTO projects(name,created_at) VALUES(?,?);',((r[0],r[2]) for r in reader))
+					self.cursor.executemany('INSERT OR IGNORE INTO projects(name,created_at) VALUES(?,DATETIME(?));',((r[0],r[2]) for r in reader))
 				self.connection.commit()
 			logger.info('Filled projects')
 
@@ -762,7 +908,7 @@ class Database(object):
 				if self.db_type == 'postgres':
 					extras.execute_batch(self.cursor,'INSERT INTO versions(name,project_id,created_at) VALUES(%s,(SELECT id FROM projects WHERE name=%s),%s) ON CONFLICT DO NOTHING;',((r[1],r[0],r[2]) for r in reader))
 				else:
-					self.cursor.executemany('INSERT OR IGNORE INTO versions(name,project_id,created_at) VALUES(?,(SELECT id FROM projects WHERE name=?),?);',((r[1],r[0],r[2]) for r in reader))
+					self.cursor.executemany('INSERT OR IGNORE INTO versions(name,project_id,created_at) VALUES(?,(SELECT id FROM projects WHERE name=?),DATETIME(?));',((r[1],r[0],r[2]) for r in reader))
 
 				self.connection.commit()
 			logger.info('Filled versions')
@@ -820,6 +966,8 @@ class Database(object):
 
 		# Converting timestamp if necessary
 		snapshot_time = utils.clean_timestamp(snapshot_time)
+		if self.db_type == 'sqlite':
+			snapshot_time_str = utils.format_timestamp(snapshot_time)
 
 
 
@@ -827,7 +975,7 @@ class Database(object):
 		if self.db_type == 'postgres':
 			self.cursor.execute('SELECT id,name FROM snapshots WHERE full_network=%s AND snapshot_time=%s;',(full_network,snapshot_time))
 		else:
-			self.cursor.execute('SELECT id,name FROM snapshots WHERE full_network=? AND snapshot_time=?;',(full_network,snapshot_time))
+			self.cursor.execute('SELECT id,name FROM snapshots WHERE full_network=? AND snapshot_time=?;',(full_network,snapshot_time_str))
 
 		ans = self.cursor.fetchone()
 
@@ -848,18 +996,25 @@ class Database(object):
 
 		else:
 			logger.info('Creating snapshot with full_network={} and snapshot_time={}'.format(full_network,snapshot_time))
+			self.clear_network_cache()
 			if self.db_type == 'postgres':
 				self.cursor.execute('INSERT INTO snapshots(name,full_network,snapshot_time) VALUES(%s,%s,%s);',(name,full_network,snapshot_time))
 			else:
-				self.cursor.execute('INSERT INTO snapshots(name,full_network,snapshot_time) VALUES(?,?,?);',(name,full_network,snapshot_time))
+				self.cursor.execute('INSERT INTO snapshots(name,full_network,snapshot_time) VALUES(?,?,?);',(name,full_network,snapshot_time_str))
 			if self.db_type == 'postgres':
 				self.cursor.execute('SELECT id,name FROM snapshots WHERE full_network=%s AND snapshot_time=%s;',(full_network,snapshot_time))
 			else:
-				self.cursor.execute('SELECT id,name FROM snapshots WHERE full_network=? AND snapshot_time=?;',(full_network,snapshot_time))
+				self.cursor.execute('SELECT id,name FROM snapshots WHERE full_network=? AND snapshot_time=?;',(full_network,snapshot_time_str))
 
 			snapid,snapname = self.cursor.fetchone()
 			logger.info('Created snapshot with full_network={} and snapshot_time={}. Id: {}, Name: {}'.format(full_network,snapshot_time,snapid,snapname))
 
+		# Temporal mode: edges of the snapshot are served by the temporal_snapshot_data view, nothing to materialize
+		if self.temporal_snapshots:
+			self.build_temporal_edges(commit=False)
+			self.connection.commit()
+			return
+
 		# Queries. Full network gets all links that existed at some point in the past. When it is set to false, it looks only at dependencies of the last version.
 		if full_network:
 			if self.db_type == 'postgres':
@@ -876,8 +1031,8 @@ class Database(object):
 						INNER JOIN projects pused
 							ON pused.id=d.project_id
 						INNER JOIN versions v
-							ON v.id=d.version_id AND (SELECT DATETIME(v.created_at))<=(SELECT DATETIME(?))
-					;''',(snapshot_time,))
+							ON v.id=d.version_id AND v.created_at<=?
+					;''',(snapshot_time_str,))
 		else:
 			if self.db_type == 'postgres':
 				self.cursor.execute('''SELECT DISTINCT v.project_id,pused.id
@@ -903,10 +1058,10 @@ class Database(object):
 							ON v.id in
 								(SELECT v1.id FROM versions v1
 									WHERE v1.project_id=v.project_id
-									AND (SELECT DATETIME(v1.created_at))<=(SELECT DATETIME(?))
-									ORDER BY created_at DESC LIMIT 1)
+									AND v1.created_at<=?
+									ORDER BY v1.created_at DESC LIMIT 1)
 							AND v.id=d.version_id
-					;''',(snapshot_time,))
+					;''',(snapshot_time_str,))
 		# print(len(list(self.cursor.fetchall())))
 
 		# Insert query results
@@ -922,6 +1077,114 @@ class Database(object):
 		#Final commit to the DB
 		self.connection.commit()
 
+	def build_temporal_edges(self,force=False,commit=True):
+		'''
+		Fills the temporal_edges table: one row per link between projects and validity interval [valid_from,valid_to), for both semantics of snapshots.
+		full_network: a link is valid from the first version using it, and never ends.
+		latest versions: a link is valid while a version using it is the latest one of the project, consecutive intervals being merged.
+
+		Rebuilding is only done if the table is empty, or if force is True.
+		'''
+		if not force and not self.is_empty(table='temporal_edges'):
+			logger.info('Table temporal_edges already filled')
+			return
+
+		logger.info('Filling temporal_edges')
+		self.clear_network_cache()
+		self.cursor.execute('DELETE FROM temporal_edges;')
+
+		# Full network
+		if self.db_type == 'postgres':
+			self.cursor.execute('''INSERT INTO temporal_edges(project_using,project_used,full_network,valid_from,valid_to)
+					SELECT v.project_id,pused.id,%s,MIN(v.created_at),NULL
+						FROM dependencies d
+						INNER JOIN projects pused
+							ON pused.id=d.project_id
+						INNER JOIN versions v
+							ON v.id=d.version_id
+						GROUP BY v.project_id,pused.id
+				;''',(True,))
+		else:
+			self.cursor.execute('''INSERT INTO temporal_edges(project_using,project_used,full_network,valid_from,valid_to)
+					SELECT v.project_id,pused.id,?,MIN(v.created_at),NULL
+						FROM dependencies d
+						INNER JOIN projects pused
+							ON pused.id=d.project_id
+						INNER JOIN versions v
+							ON v.id=d.version_id
+						GROUP BY v.project_id,pused.id
+				;''',(True,))
+
+		# Latest versions: each version is the latest one of its project until the next version is created
+		read_cursor = self.connection.cursor()
+		if self.db_type == 'postgres':
+			read_cursor.execute('''SELECT vi.project_id,pused.id,vi.valid_from,vi.valid_to
+					FROM (SELECT id,project_id,created_at AS valid_from,
+							LEAD(created_at) OVER (PARTITION BY project_id ORDER BY created_at,id) AS valid_to
+							FROM versions) vi
+					INNER JOIN dependencies d
+						ON d.version_id=vi.id
+					INNER JOIN projects pused
+						ON pused.id=d.project_id
+					ORDER BY vi.project_id,pused.id,vi.valid_from
+				;''')
+		else:
+			read_cursor.execute('''SELECT vi.project_id,pused.id,vi.valid_from,vi.valid_to
+					FROM (SELECT id,project_id,created_at AS valid_from,
+							LEAD(created_at) OVER (PARTITION BY project_id ORDER BY created_at,id) AS valid_to
+							FROM versions) vi
+					INNER JOIN dependencies d
+						ON d.version_id=vi.id
+					INNER JOIN projects pused
+						ON pused.id=d.project_id
+					ORDER BY vi.project_id,pused.id,vi.valid_from
+				;''')
+
+		def merged_intervals():
+			current = None
+			for using,used,valid_from,valid_to in read_cursor:
+				if valid_to is not None and valid_to == valid_from: # version immediately superseded by another one with the same timestamp
+					continue
+				if current is not None and current[:2] == (using,used) and current[3] == valid_from:
+					current[3] = valid_to
+				else:
+					if current is not None:
+						yield tuple(current)
+					current = [using,used,valid_from,valid_to]
+			if current is not None:
+				yield tuple(current)
+
+		if self.db_type == 'postgres':
+			extras.execute_batch(self.cursor,'''
+				INSERT INTO temporal_edges(project_using,project_used,full_network,valid_from,valid_to) VALUES(%s,%s,%s,%s,%s);
+				''',((using,used,False,valid_from,valid_to) for using,used,valid_from,valid_to in merged_intervals()))
+		else:
+			self.cursor.executemany('''
+				INSERT INTO temporal_edges(project_using,project_used,full_network,valid_from,valid_to) VALUES(?,?,?,?,?);
+				''',((using,used,False,valid_from,valid_to) for using,used,valid_from,valid_to in merged_intervals()))
+		read_cursor.close()
+
+		if commit:
+			self.connection.commit()
+		logger.info('Filled temporal_edges')
+
+	def get_temporal_edges(self,snapshot_time,full_network=False):
+		'''
+		Returns the edge list valid at any given time, without needing a registered snapshot.
+		temporal_edges is filled first if necessary.
+		'''
+		snapshot_time = utils.clean_timestamp(snapshot_time)
+		self.build_temporal_edges()
+		if self.db_type == 'postgres':
+			self.cursor.execute('''SELECT project_using,project_used FROM temporal_edges
+					WHERE full_network=%s AND valid_from<=%s AND (valid_to IS NULL OR valid_to>%s)
+				;''',(full_network,snapshot_time,snapshot_time))
+		else:
+			self.cursor.execute('''SELECT project_using,project_used FROM temporal_edges
+					WHERE full_network=? AND valid_from<=? AND (valid_to IS NULL OR valid_to>?)
+				;''',(full_network,utils.format_timestamp(snapshot_time),utils.format_timestamp(snapshot_time)))
+		return list(self.cursor.fetchall())
+
 	def get_project_id(self,project_name,raise_error=True):
 		'''
 		returns the id of a project given the name
@@ -992,7 +1255,7 @@ class Database(object):
 			if self.db_type == 'postgres':
 				self.cursor.execute('SELECT id FROM snapshots WHERE full_network=%s AND snapshot_time=%s;',(full_network,snapshot_time))
 			else:
-				self.cursor.execute('SELECT id FROM snapshots WHERE full_network=? AND (SELECT DATETIME(snapshot_time))=(SELECT DATETIME(?));',(full_network,snapshot_time))
+				self.cursor.execute('SELECT id FROM snapshots WHERE full_network=? AND snapshot_time=?;',(full_network,utils.format_timestamp(snapshot_time)))
 
 			id_list = [r[0] for r in self.cursor.fetchall()]
 			if len(id_list)==1:
@@ -1014,6 +1277,10 @@ class Database(object):
 		'''
 		if snapshot_time is not None:
 			snaptime = snapshot_time
+		elif snapshot_id in self.network_cache:
+			self.cache_hits += 1
+			self.network_cache.move_to_end(snapshot_id)
+			return self.network_cache[snapshot_id][1].tolist()
 		elif snapshot_id is not None:
 			if self.db_type == 'postgres':
 				self.cursor.execute('SELECT snapshot_time FROM snapshots WHERE id=%s;',(snapshot_id,))
@@ -1033,7 +1300,7 @@ class Database(object):
 		if self.db_type == 'postgres':
 			self.cursor.execute('SELECT id FROM projects WHERE created_at<=%s ORDER BY id;',(snaptime,))
 		else:
-			self.cursor.execute('SELECT id FROM projects WHERE created_at<=(SELECT DATETIME(?)) ORDER BY id;',(snaptime,))
+			self.cursor.execute('SELECT id FROM projects WHERE created_at<=? ORDER BY id;',(utils.format_timestamp(snaptime),))
 		return [r[0] for r in self.cursor.fetchall()]
 
 
@@ -1048,22 +1315,61 @@ class Database(object):
 		'''
 		snapid = self.get_snapshot_id(snapshot_id=snapshot_id,snapshot_name=snapshot_name,snapshot_time=snapshot_time,full_network=full_network,create=create)
 
-		logger.info('Getting elements of snapshot {}'.format(snapid))
-
-		if self.db_type == 'postgres':
-			self.cursor.execute('SELECT project_using,project_used FROM snapshot_data WHERE snapshot_id=%s;',(snapid,))
-		else:
-			self.cursor.execute('SELECT project_using,project_used FROM snapshot_data WHERE snapshot_id=?;',(snapid,))
-
-		edge_list = list(self.cursor.fetchall()) # Could be used/returned as a generator
+		edges,nodes = self.get_network_arrays(snapshot_id=snapid)
 		if as_nx_obj:
 			g = nx.DiGraph()
-			node_list = self.get_nodes(snapshot_id=snapid,snapshot_time=snapshot_time)
-			g.add_nodes_from(node_list)
-			g.add_edges_from(edge_list)
+			g.add_nodes_from(nodes.tolist())
+			g.add_edges_from(edges.tolist())
 			return g
 		else:
-			return edge_list
+			return [tuple(e) for e in edges.tolist()]
+
+	def get_network_arrays(self,snapshot_id):
+		'''
+		Returns the edges (array of shape (nb_edges,2), columns project_using,project_used) and the sorted nodes of a snapshot.
+		The last network_cache_size results are kept in an LRU cache, invalidated when snapshots or dependencies are modified.
+		Arrays are read-only, as they are shared between calls.
+		'''
+		if snapshot_id in self.network_cache:
+			self.cache_hits += 1
+			self.network_cache.move_to_end(snapshot_id)
+			return self.network_cache[snapshot_id]
+
+		self.cache_misses += 1
+		logger.info('Getting elements of snapshot {}'.format(snapshot_id))
+
+		if self.temporal_snapshots:
+			snapshot_table = 'temporal_snapshot_data'
+		else:
+			snapshot_table = 'snapshot_data'
+
+		if self.db_type == 'postgres':
+			self.cursor.execute('SELECT project_using,project_used FROM {} WHERE snapshot_id=%s;'.format(snapshot_table),(snapshot_id,))
+		else:
+			self.cursor.execute('SELECT project_using,project_used FROM {} WHERE snapshot_id=?;'.format(snapshot_table),(snapshot_id,))
+
+		edges = np.asarray(self.cursor.fetchall(),dtype=np.int64).reshape((-1,2))
+		nodes = np.asarray(self.get_nodes(snapshot_id=snapshot_id),dtype=np.int64)
+		edges.flags.writeable = False
+		nodes.flags.writeable = False
+
+		if self.network_cache_size > 0:
+			self.network_cache[snapshot_id] = (edges,nodes)
+			while len(self.network_cache) > self.network_cache_size:
+				self.network_cache.popitem(last=False)
+		return edges,nodes
+
+	def clear_network_cache(self):
+		'''
+		Invalidates the in-memory cache of snapshot networks
+		'''
+		self.network_cache.clear()
+
+	def network_cache_info(self):
+		'''
+		Returns hit/miss counters and current size of the network cache
+		'''
+		return {'hits':self.cache_hits,'misses':self.cache_misses,'size':len(self.network_cache),'max_size':self.network_cache_size}
 
 	def detect_cycles(self,snapshot_id,cycle_length=None,convert_to_names=True):
 		'''
@@ -1073,44 +1379,49 @@ class Database(object):
 		Returning a tuple per (distinct) cycle, beginning at the lowest project id for each cycle.
 		Auto-excluding smaller length subcycles.
 		'''
+		if self.temporal_snapshots:
+			snapshot_table = 'temporal_snapshot_data'
+		else:
+			snapshot_table = 'snapshot_data'
+
 		if cycle_length == 1:
 			if self.db_type == 'postgres':
-				self.cursor.execute('SELECT project_used FROM snapshot_data WHERE snapshot_id=%s AND project_used=project_using;',(snapshot_id,))
+				self.cursor.execute('SELECT project_used FROM {snapshot_table} WHERE snapshot_id=%s AND project_used=project_using;'.format(snapshot_table=snapshot_table),(snapshot_id,))
 			else:
-				self.cursor.execute('SELECT project_used FROM snapshot_data WHERE snapshot_id=? AND project_used=project_using;',(snapshot_id,))
+				self.cursor.execute('SELECT project_used FROM {snapshot_table} WHERE snapshot_id=? AND project_used=project_using;'.format(snapshot_table=snapshot_table),(snapshot_id,))
 		elif cycle_length == 2:
 			if self.db_type == 'postgres':
 				self.cursor.execute('''
-					SELECT sd1.project_using,sd1.project_used FROM snapshot_data sd1
-						INNER JOIN snapshot_data sd2
+					SELECT sd1.project_using,sd1.project_used FROM {snapshot_table} sd1
+						INNER JOIN {snapshot_table} sd2
 							ON sd1.snapshot_id=%s AND sd2.snapshot_id=%s
 							AND sd1.project_using<sd1.project_used -- uniqueness of results
 							AND sd1.project_used=sd2.project_using  -- propagation to sd2
 							AND sd2.project_used=sd1.project_using  -- propagation to sd1
 							AND sd1.project_using!=sd1.project_used -- no 1-cycle
-							;''',(snapshot_id,snapshot_id,))
+							;'''.format(snapshot_table=snapshot_table),(snapshot_id,snapshot_id,))
 			else:
 				self.cursor.execute('''
-					SELECT sd1.project_using,sd1.project_used FROM snapshot_data sd1
-						INNER JOIN snapshot_data sd2
+					SELECT sd1.project_using,sd1.project_used FROM {snapshot_table} sd1
+						INNER JOIN {snapshot_table} sd2
 							ON sd1.snapshot_id=? AND sd2.snapshot_id=?
 							AND sd1.project_using<sd1.project_used -- uniqueness of results
 							AND sd1.project_used=sd2.project_using  -- propagation to sd2
 							AND sd2.project_used=sd1.project_using  -- propagation to sd1
 							AND sd1.project_using!=sd1.project_used -- no 1-cycle
-							;''',(snapshot_id,snapshot_id,))
+							;'''.format(snapshot_table=snapshot_table),(snapshot_id,snapshot_id,))
 		elif cycle_length == 3:
 			if self.db_type == 'postgres':
 				self.cursor.execute('''
-					SELECT sd1.project_using,sd2.project_using,sd3.project_using FROM snapshot_data sd1
-						INNER JOIN snapshot_data sd2
+					SELECT sd1.project_using,sd2.project_using,sd3.project_using FROM {snapshot_table} sd1
+						INNER JOIN {snapshot_table} sd2
 							ON sd1.snapshot_id=%s AND sd2.snapshot_id=%s
 							AND sd1.project_used=sd2.project_using  -- propagation to sd2
 							AND sd1.project_using!=sd1.project_used  -- no 1-cycle in sd1
 							AND sd2.project_using!=sd2.project_used  -- no 1-cycle in sd2
 							AND sd1.project_using!=sd2.project_used  -- no 2-cycle in sd1-sd2
 							AND sd1.project_using<sd2.project_using -- uniqueness first step -- might be combined with other statements
-						INNER JOIN snapshot_data sd3
+						INNER JOIN {snapshot_table} sd3
 							ON sd3.snapshot_id=%s
 							AND sd2.project_used=sd3.project_using   -- propagation to sd3
 							AND sd3.project_used=sd1.project_using    -- propagation to sd1
@@ -1118,18 +1429,18 @@ class Database(object):
 							AND sd2.project_using!=sd3.project_used  -- no 2-cycle in sd2-sd3
 							AND sd3.project_using!=sd1.project_used  -- no 2-cycle in sd3-sd1
 							AND sd1.project_using<sd3.project_using -- uniqueness second step -- might be combined with other statements
-						;''',(snapshot_id,snapshot_id,snapshot_id,))
+						;'''.format(snapshot_table=snapshot_table),(snapshot_id,snapshot_id,snapshot_id,))
 			else:
 				self.cursor.execute('''
-					SELECT sd1.project_using,sd2.project_using,sd3.project_using FROM snapshot_data sd1
-						INNER JOIN snapshot_data sd2
+					SELECT sd1.project_using,sd2.project_using,sd3.project_using FROM {snapshot_table} sd1
+						INNER JOIN {snapshot_table} sd2
 							ON sd1.snapshot_id=? AND sd2.snapshot_id=?
 							AND sd1.project_used=sd2.project_using  -- propagation to sd2
 							AND sd1.project_using!=sd1.project_used  -- no 1-cycle in sd1
 							AND sd2.project_using!=sd2.project_used  -- no 1-cycle in sd2
 							AND sd1.project_using!=sd2.project_used  -- no 2-cycle in sd1-sd2
 							AND sd1.project_using<sd2.project_using -- uniqueness first step -- might be combined with other statements
-						INNER JOIN snapshot_data sd3
+						INNER JOIN {snapshot_table} sd3
 							ON sd3.snapshot_id=?
 							AND sd2.project_used=sd3.project_using   -- propagation to sd3
 							AND sd3.project_used=sd1.project_using    -- propagation to sd1
@@ -1137,26 +1448,26 @@ class Database(object):
 							AND sd2.project_using!=sd3.project_used  -- no 2-cycle in sd2-sd3
 							AND sd3.project_using!=sd1.project_used  -- no 2-cycle in sd3-sd1
 							AND sd1.project_using<sd3.project_using -- uniqueness second step -- might be combined with other statements
-						;''',(snapshot_id,snapshot_id,snapshot_id,))
+						;'''.format(snapshot_table=snapshot_table),(snapshot_id,snapshot_id,snapshot_id,))
 		elif cycle_length == 4:
 			if self.db_type == 'postgres':
 				self.cursor.execute('''
-					SELECT sd1.project_using,sd2.project_using,sd3.project_using FROM snapshot_data sd1
-						INNER JOIN snapshot_data sd2
+					SELECT sd1.project_using,sd2.project_using,sd3.project_using FROM {snapshot_table} sd1
+						INNER JOIN {snapshot_table} sd2
 							ON sd1.snapshot_id=%s AND sd2.snapshot_id=%s
 							AND sd1.project_used=sd2.project_using  -- propagation to sd2
 							AND sd1.project_using!=sd1.project_used  -- no 1-cycle in sd1
 							AND sd2.project_using!=sd2.project_used  -- no 1-cycle in sd2
 							AND sd1.project_using!=sd2.project_used  -- no 2-cycle in sd1-sd2
 							AND sd1.project_using<sd2.project_using -- uniqueness first step -- might be combined with other statements
-						INNER JOIN snapshot_data sd3
+						INNER JOIN {snapshot_table} sd3
 							ON sd3.snapshot_id=%s
 							AND sd2.project_used=sd3.project_using   -- propagation to sd3
 							AND sd3.project_using!=sd3.project_used  -- no 1-cycle in sd3
 							AND sd2.project_using!=sd3.project_used  -- no 2-cycle in sd2-sd3
 							AND sd1.project_using<sd3.project_using -- uniqueness second step -- might be combined with other statements
 							AND sd3.project_used!=sd1.project_using  -- no 3-cycle in sd1-sd3
-						INNER JOIN snapshot_data sd4
+						INNER JOIN {snapshot_table} sd4
 							ON sd4.snapshot_id=%s
 							AND sd3.project_used=sd3.project_using   -- propagation to sd4
 							AND sd4.project_used=sd1.project_using    -- propagation to sd1
@@ -1165,25 +1476,25 @@ class Database(object):
 							AND sd4.project_using!=sd1.project_used  -- no 2-cycle in sd4-sd1
 							AND sd1.project_using<sd4.project_using -- uniqueness third step -- might be combined with other statements
 							AND sd4.project_used!=sd2.project_using  -- no 3-cycle in sd2-sd4
-						;''',(snapshot_id,snapshot_id,snapshot_id,snapshot_id,))
+						;'''.format(snapshot_table=snapshot_table),(snapshot_id,snapshot_id,snapshot_id,snapshot_id,))
 			else:
 				self.cursor.execute('''
-					SELECT sd1.project_using,sd2.project_using,sd3.project_using FROM snapshot_data sd1
-						INNER JOIN snapshot_data sd2
+					SELECT sd1.project_using,sd2.project_using,sd3.project_using FROM {snapshot_table} sd1
+						INNER JOIN {snapshot_table} sd2
 							ON sd1.snapshot_id=? AND sd2.snapshot_id=?
 							AND sd1.project_used=sd2.project_using  -- propagation to sd2
 							AND sd1.project_using!=sd1.project_used  -- no 1-cycle in sd1
 							AND sd2.project_using!=sd2.project_used  -- no 1-cycle in sd2
 							AND sd1.project_using!=sd2.project_used  -- no 2-cycle in sd1-sd2
 							AND sd1.project_using<sd2.project_using -- uniqueness first step -- might be combined with other statements
-						INNER JOIN snapshot_data sd3
+						INNER JOIN {snapshot_table} sd3
 							ON sd3.snapshot_id=?
 							AND sd2.project_used=sd3.project_using   -- propagation to sd3
 							AND sd3.project_using!=sd3.project_used  -- no 1-cycle in sd3
 							AND sd2.project_using!=sd3.project_used  -- no 2-cycle in sd2-sd3
 							AND sd1.project_using<sd3.project_using -- uniqueness second step -- might be combined with other statements
 							AND sd3.project_used!=sd1.project_using  -- no 3-cycle in sd1-sd3
-						INNER JOIN snapshot_data sd4
+						INNER JOIN {snapshot_table} sd4
 							ON sd4.snapshot_id=?
 							AND sd3.project_used=sd3.project_using   -- propagation to sd4
 							AND sd4.project_used=sd1.project_using    -- propagation to sd1
@@ -1192,7 +1503,7 @@ class Database(object):
 							AND sd4.project_using!=sd1.project_used  -- no 2-cycle in sd4-sd1
 							AND sd1.project_using<sd4.project_using -- uniqueness third step -- might be combined with other statements
 							AND sd4.project_used!=sd2.project_using  -- no 3-cycle in sd2-sd4
-						;''',(snapshot_id,snapshot_id,snapshot_id,snapshot_id,))
+						;'''.format(snapshot_table=snapshot_table),(snapshot_id,snapshot_id,snapshot_id,snapshot_id,))
 		elif cycle_length is None:
 			net = self.get_network(snapshot_id=snapshot_id,as_nx_obj=True)
 			logger.info('Trying to find a cycle, of any length')
@@ -1216,6 +1527,46 @@ class Database(object):
 			return ans
 
 
+	def get_cfg_id(self,cfg,create=True):
+		'''
+		Returns the integer id of a configuration dict (simulation, measure or exact computation cfg) in sim_configs.
+		Configurations are interned on first use, and ids are cached in memory.
+		If create is False and the configuration is unknown, returns None.
+		'''
+		cfg_str = json.dumps(cfg, indent=None, sort_keys=True)
+		if cfg_str in self.cfg_ids:
+			return self.cfg_ids[cfg_str]
+		if self.db_type == 'postgres':
+			if create:
+				self.cursor.execute('INSERT INTO sim_configs(cfg) VALUES(%s) ON CONFLICT DO NOTHING;',(cfg_str,))
+			self.cursor.execute('SELECT id FROM sim_configs WHERE cfg=%s;',(cfg_str,))
+		else:
+			if create:
+				self.cursor.execute('INSERT OR IGNORE INTO sim_configs(cfg) VALUES(?);',(cfg_str,))
+			self.cursor.execute('SELECT id FROM sim_configs WHERE cfg=?;',(cfg_str,))
+		ans = self.cursor.fetchone()
+		if ans is None:
+			return None
+		else:
+			self.cfg_ids[cfg_str] = ans[0]
+			return ans[0]
+
+	def get_cfg(self,cfg_id):
+		'''
+		Returns the configuration dict corresponding to an id of sim_configs
+		'''
+		if self.db_type == 'postgres':
+			self.cursor.execute('SELECT cfg FROM sim_configs WHERE id=%s;',(cfg_id,))
+		else:
+			self.cursor.execute('SELECT cfg FROM sim_configs WHERE id=?;',(cfg_id,))
+		ans = self.cursor.fetchone()
+		if ans is None:
+			raise ValueError('No configuration with id {}'.format(cfg_id))
+		elif isinstance(ans[0],str):
+			return json.loads(ans[0])
+		else:
+			return ans[0]
+
 	def register_simulation(self,simulation,snapshot_id=None,commit=True):
 		'''
 		Registers a simulation object into the database
@@ -1229,14 +1580,14 @@ class Database(object):
 			raise ValueError('Provide a snapshot_id to register the simulation, or set it within the simulation object, or get the simulation from an experiment manager object')
 		else:
 			if self.db_type == 'postgres':
-				self.cursor.execute(''' INSERT INTO simulations(snapshot_id,sim_cfg,random_seed,failing_project)
+				self.cursor.execute(''' INSERT INTO simulations(snapshot_id,sim_cfg_id,random_seed,failing_project)
 					VALUES(%s,%s,%s,%s)
 					ON CONFLICT DO NOTHING;
-					;''',(snapshot_id,json.dumps(simulation.sim_cfg, indent=None, sort_keys=True),simulation.random_seed,simulation.failing_project))
+					;''',(snapshot_id,self.get_cfg_id(simulation.sim_cfg),simulation.random_seed,simulation.failing_project))
 			else:
-				self.cursor.execute('''INSERT OR IGNORE INTO simulations(snapshot_id,sim_cfg,random_seed,failing_project)
+				self.cursor.execute('''INSERT OR IGNORE INTO simulations(snapshot_id,sim_cfg_id,random_seed,failing_project)
 					VALUES(?,?,?,?)
-					;''',(snapshot_id,json.dumps(simulation.sim_cfg, indent=None, sort_keys=True),simulation.random_seed,simulation.failing_project))
+					;''',(snapshot_id,self.get_cfg_id(simulation.sim_cfg),simulation.random_seed,simulation.failing_project))
 
 			if simulation.results is not None:
 				self.submit_simulation_results(simulation=simulation,snapshot_id=snapshot_id,commit=False)
@@ -1259,10 +1610,10 @@ class Database(object):
 				if sim_id is None:
 					self.cursor.execute('''SELECT id,executed FROM simulations
 								WHERE snapshot_id=%s
-								AND sim_cfg=%s
+								AND sim_cfg_id=%s
 								AND random_seed=%s
 								AND failing_project=%s
-					;''',(snapshot_id,json.dumps(simulation.sim_cfg, indent=None, sort_keys=True),simulation.random_seed,simulation.failing_project))
+					;''',(snapshot_id,self.get_cfg_id(simulation.sim_cfg),simulation.random_seed,simulation.failing_project))
 
 					sim_id_list = self.cursor.fetchone()
 					if sim_id_list is None:
@@ -1278,14 +1629,15 @@ class Database(object):
 						VALUES(%s,%s)
 						;''',((sim_id,fp) for fp in simulation.results['ids']))
 				self.cursor.execute('''UPDATE simulations SET executed=TRUE WHERE id=%s;''',(sim_id,))
+				self.update_sim_aggregates(snapshot_id=snapshot_id,sim_cfg_id=self.get_cfg_id(simulation.sim_cfg),failing_project=simulation.failing_project,failing_list=simulation.results['ids'])
 			else:
 				if sim_id is None:
 					self.cursor.execute('''SELECT id,executed FROM simulations
 								WHERE snapshot_id=?
-								AND sim_cfg=?
+								AND sim_cfg_id=?
 								AND random_seed=?
 								AND failing_project=?
-					;''',(snapshot_id,json.dumps(simulation.sim_cfg, indent=None, sort_keys=True),simulation.random_seed,simulation.failing_project))
+					;''',(snapshot_id,self.get_cfg_id(simulation.sim_cfg),simulation.random_seed,simulation.failing_project))
 
 					sim_id_list = self.cursor.fetchone()
 					if sim_id_list is None:
@@ -1302,9 +1654,123 @@ class Database(object):
 						;''',((sim_id,fp) for fp in simulation.results['ids']))
 
 				self.cursor.execute('''UPDATE simulations SET executed=1 WHERE id=?;''',(sim_id,))
+				self.update_sim_aggregates(snapshot_id=snapshot_id,sim_cfg_id=self.get_cfg_id(simulation.sim_cfg),failing_project=simulation.failing_project,failing_list=simulation.results['ids'])
 			if commit:
 				self.connection.commit()
 
+	def update_sim_aggregates(self,snapshot_id,sim_cfg_id,failing_project,failing_list,nb_runs=1):
+		'''
+		Adds executed runs to the aggregate tables sim_agg and sim_agg_failing.
+		failing_list contains the failing projects of all the added runs (with repetitions if several runs are added at once).
+		Does not commit, called within the transaction writing the corresponding simulation results.
+		'''
+		failing_counts = collections.Counter(failing_list)
+		if self.db_type == 'postgres':
+			self.cursor.execute('''INSERT INTO sim_agg(snapshot_id,sim_cfg_id,failing_project,nb_runs,sum_failing)
+					VALUES(%s,%s,%s,%s,%s)
+					ON CONFLICT(snapshot_id,sim_cfg_id,failing_project) DO UPDATE
+						SET nb_runs=sim_agg.nb_runs+EXCLUDED.nb_runs,
+						sum_failing=sim_agg.sum_failing+EXCLUDED.sum_failing
+				;''',(snapshot_id,sim_cfg_id,failing_project,nb_runs,len(failing_list)))
+			extras.execute_batch(self.cursor,'''INSERT INTO sim_agg_failing(snapshot_id,sim_cfg_id,failing_project,failing,nb_failing)
+					VALUES(%s,%s,%s,%s,%s)
+					ON CONFLICT(snapshot_id,sim_cfg_id,failing_project,failing) DO UPDATE
+						SET nb_failing=sim_agg_failing.nb_failing+EXCLUDED.nb_failing
+				;''',((snapshot_id,sim_cfg_id,failing_project,fp,val) for fp,val in failing_counts.items()))
+		else:
+			self.cursor.execute('''INSERT INTO sim_agg(snapshot_id,sim_cfg_id,failing_project,nb_runs,sum_failing)
+					VALUES(?,?,?,?,?)
+					ON CONFLICT(snapshot_id,sim_cfg_id,failing_project) DO UPDATE
+						SET nb_runs=sim_agg.nb_runs+excluded.nb_runs,
+						sum_failing=sim_agg.sum_failing+excluded.sum_failing
+				;''',(snapshot_id,sim_cfg_id,failing_project,nb_runs,len(failing_list)))
+			self.cursor.executemany('''INSERT INTO sim_agg_failing(snapshot_id,sim_cfg_id,failing_project,failing,nb_failing)
+					VALUES(?,?,?,?,?)
+					ON CONFLICT(snapshot_id,sim_cfg_id,failing_project,failing) DO UPDATE
+						SET nb_failing=sim_agg_failing.nb_failing+excluded.nb_failing
+				;''',((snapshot_id,sim_cfg_id,failing_project,fp,val) for fp,val in failing_counts.items()))
+
+	def copy_simulations(self,from_snapshot_id,to_snapshot_id,sim_cfg_id,failing_projects,commit=True):
+		'''
+		Copies executed simulations of the given source projects, with their results and aggregates, from one snapshot to another.
+		Used when cascades are known to be identical in both snapshots (common random numbers, unchanged dependents).
+		Source projects should not have simulations for this configuration in the target snapshot yet.
+		'''
+		params = [(to_snapshot_id,from_snapshot_id,sim_cfg_id,int(fp)) for fp in failing_projects]
+		if self.db_type == 'postgres':
+			extras.execute_batch(self.cursor,'''INSERT INTO simulations(snapshot_id,sim_cfg_id,random_seed,failing_project,executed)
+					SELECT %s,sim_cfg_id,random_seed,failing_project,executed FROM simulations
+						WHERE snapshot_id=%s AND sim_cfg_id=%s AND failing_project=%s AND executed
+				;''',params)
+			extras.execute_batch(self.cursor,'''INSERT INTO simulation_results(simulation_id,failing)
+					SELECT s_new.id,sr.failing FROM simulations s_old
+						INNER JOIN simulation_results sr
+						ON sr.simulation_id=s_old.id
+						INNER JOIN simulations s_new
+						ON s_new.snapshot_id=%s AND s_new.sim_cfg_id=s_old.sim_cfg_id
+						AND s_new.failing_project=s_old.failing_project AND s_new.random_seed=s_old.random_seed
+						WHERE s_old.snapshot_id=%s AND s_old.sim_cfg_id=%s AND s_old.failing_project=%s AND s_old.executed
+				;''',params)
+			extras.execute_batch(self.cursor,'''INSERT INTO sim_agg(snapshot_id,sim_cfg_id,failing_project,nb_runs,sum_failing)
+					SELECT %s,sim_cfg_id,failing_project,nb_runs,sum_failing FROM sim_agg
+						WHERE snapshot_id=%s AND sim_cfg_id=%s AND failing_project=%s
+				;''',params)
+			extras.execute_batch(self.cursor,'''INSERT INTO sim_agg_failing(snapshot_id,sim_cfg_id,failing_project,failing,nb_failing)
+					SELECT %s,sim_cfg_id,failing_project,failing,nb_failing FROM sim_agg_failing
+						WHERE snapshot_id=%s AND sim_cfg_id=%s AND failing_project=%s
+				;''',params)
+		else:
+			self.cursor.executemany('''INSERT INTO simulations(snapshot_id,sim_cfg_id,random_seed,failing_project,executed)
+					SELECT ?,sim_cfg_id,random_seed,failing_project,executed FROM simulations
+						WHERE snapshot_id=? AND sim_cfg_id=? AND failing_project=? AND executed
+				;''',params)
+			self.cursor.executemany('''INSERT INTO simulation_results(simulation_id,failing)
+					SELECT s_new.id,sr.failing FROM simulations s_old
+						INNER JOIN simulation_results sr
+						ON sr.simulation_id=s_old.id
+						INNER JOIN simulations s_new
+						ON s_new.snapshot_id=? AND s_new.sim_cfg_id=s_old.sim_cfg_id
+						AND s_new.failing_project=s_old.failing_project AND s_new.random_seed=s_old.random_seed
+						WHERE s_old.snapshot_id=? AND s_old.sim_cfg_id=? AND s_old.failing_project=? AND s_old.executed
+				;''',params)
+			self.cursor.executemany('''INSERT INTO sim_agg(snapshot_id,sim_cfg_id,failing_project,nb_runs,sum_failing)
+					SELECT ?,sim_cfg_id,failing_project,nb_runs,sum_failing FROM sim_agg
+						WHERE snapshot_id=? AND sim_cfg_id=? AND failing_project=?
+				;''',params)
+			self.cursor.executemany('''INSERT INTO sim_agg_failing(snapshot_id,sim_cfg_id,failing_project,failing,nb_failing)
+					SELECT ?,sim_cfg_id,failing_project,failing,nb_failing FROM sim_agg_failing
+						WHERE snapshot_id=? AND sim_cfg_id=? AND failing_project=?
+				;''',params)
+		if commit:
+			self.connection.commit()
+
+	def rebuild_sim_aggregates(self,commit=True):
+		'''
+		Recomputes sim_agg and sim_agg_failing from scratch out of simulations and simulation_results.
+		Useful for databases filled before the aggregate tables existed.
+		'''
+		logger.info('Rebuilding simulation aggregates')
+		self.cursor.execute('DELETE FROM sim_agg_failing;')
+		self.cursor.execute('DELETE FROM sim_agg;')
+		self.cursor.execute('''INSERT INTO sim_agg(snapshot_id,sim_cfg_id,failing_project,nb_runs,sum_failing)
+				SELECT s.snapshot_id,s.sim_cfg_id,s.failing_project,COUNT(DISTINCT s.id),COUNT(sr.failing)
+					FROM simulations s
+					LEFT OUTER JOIN simulation_results sr
+					ON sr.simulation_id=s.id
+					WHERE s.executed
+					GROUP BY s.snapshot_id,s.sim_cfg_id,s.failing_project
+			;''')
+		self.cursor.execute('''INSERT INTO sim_agg_failing(snapshot_id,sim_cfg_id,failing_project,failing,nb_failing)
+				SELECT s.snapshot_id,s.sim_cfg_id,s.failing_project,sr.failing,COUNT(*)
+					FROM simulations s
+					INNER JOIN simulation_results sr
+					ON sr.simulation_id=s.id
+					WHERE s.executed
+					GROUP BY s.snapshot_id,s.sim_cfg_id,s.failing_project,sr.failing
+			;''')
+		if commit:
+			self.connection.commit()
+
 	def delete_dependency(self,source,target):
 		'''
 		deletes all dependencies between any version of source to target
@@ -1337,11 +1803,14 @@ class Database(object):
 				self.cursor.execute('''
 					INSERT INTO deleted_dependencies(project_using,project_used,deletions) VALUES(%s,%s,%s)
 					;''',(source,target,deleted))
+				self.cursor.execute('DELETE FROM temporal_edges WHERE project_using=%s AND project_used=%s;',(source,target))
 			else:
 				self.cursor.execute('''
 					INSERT INTO deleted_dependencies(project_using,project_used,deletions) VALUES(?,?,?)
 					;''',(source,target,deleted))
+				self.cursor.execute('DELETE FROM temporal_edges WHERE project_using=? AND project_used=?;',(source,target))
 			self.connection.commit()
+			self.clear_network_cache()
 			logger.info('Deleted dependency links from {} to {}'.format(source,target))
 
 	def delete_auto_dependencies(self):
@@ -1377,42 +1846,94 @@ class Database(object):
 			if s_id is not None and t_id is not None:
 				self.delete_dependency(source=s_id,target=t_id)
 
-	def fill_measures(self,measure,snapshot_id,value_vec,projid_vec,**measure_cfg):
+	def bulk_insert(self,table,columns,arrays,fmt=None):
 		'''
-		Fills in results of a measure
-		TODO: autocomplete measure_cfg
+		Inserts rows given as one numpy array per column.
+		For postgres, data is streamed with COPY; for SQLite, with a single executemany.
+		Does not commit.
+		fmt: list of printf-style formats for the COPY text (default: integers, except float arrays)
 		'''
+		arrays = [np.asarray(a) for a in arrays]
+		if len(arrays[0]) == 0:
+			return
 		if self.db_type == 'postgres':
-			self.cursor.execute('INSERT INTO measure_types(name,cfg) VALUES(%s,%s) ON CONFLICT DO NOTHING;',(measure,json.dumps(measure_cfg, indent=None, sort_keys=True)))
-			self.cursor.execute('SELECT id FROM measure_types WHERE name=%s AND cfg=%s;',(measure,json.dumps(measure_cfg, indent=None, sort_keys=True)))
+			if fmt is None:
+				fmt = ['%.17g' if a.dtype.kind == 'f' else '%d' for a in arrays]
+			buf = io.StringIO()
+			np.savetxt(buf,np.rec.fromarrays(arrays),fmt=fmt,delimiter='\t')
+			buf.seek(0)
+			self.cursor.copy_from(buf,table,sep='\t',columns=columns)
 		else:
-			self.cursor.execute('INSERT OR IGNORE INTO measure_types(name,cfg) VALUES(?,?);',(measure,json.dumps(measure_cfg, indent=None, sort_keys=True)))
-			self.cursor.execute('SELECT id FROM measure_types WHERE name=? AND cfg=?;',(measure,json.dumps(measure_cfg, indent=None, sort_keys=True)))
-
-		measure_id = self.cursor.fetchone()[0]
+			self.cursor.executemany('INSERT INTO {}({}) VALUES({});'.format(table,','.join(columns),','.join(['?' for _ in columns])),zip(*[a.tolist() for a in arrays]))
 
+	def get_measure_id(self,measure,create=True,**measure_cfg):
+		'''
+		Returns the id of a measure type (name and configuration), creating it if necessary.
+		Returns None if it does not exist and create is False.
+		'''
+		cfg_id = self.get_cfg_id(measure_cfg,create=create)
+		if cfg_id is None:
+			return None
 		if self.db_type == 'postgres':
-			self.cursor.execute('SELECT * FROM  computed_measures WHERE measure_id=%s AND snapshot_id=%s;',(measure_id,snapshot_id))
+			if create:
+				self.cursor.execute('INSERT INTO measure_types(name,cfg_id) VALUES(%s,%s) ON CONFLICT DO NOTHING;',(measure,cfg_id))
+			self.cursor.execute('SELECT id FROM measure_types WHERE name=%s AND cfg_id=%s;',(measure,cfg_id))
+		else:
+			if create:
+				self.cursor.execute('INSERT OR IGNORE INTO measure_types(name,cfg_id) VALUES(?,?);',(measure,cfg_id))
+			self.cursor.execute('SELECT id FROM measure_types WHERE name=? AND cfg_id=?;',(measure,cfg_id))
+		ans = self.cursor.fetchone()
+		if ans is None:
+			return None
 		else:
-			self.cursor.execute('SELECT * FROM  computed_measures WHERE measure_id=? AND snapshot_id=?;',(measure_id,snapshot_id))
+			return ans[0]
+
+	def fill_measures(self,measure,snapshot_id,value_vec,projid_vec,commit=True,**measure_cfg):
+		'''
+		Fills in results of a measure
+		TODO: autocomplete measure_cfg
+		'''
+		self.fill_measures_bulk(measure=measure,measure_data=[(snapshot_id,value_vec,projid_vec)],commit=commit,**measure_cfg)
+
+	def fill_measures_bulk(self,measure,measure_data,commit=True,**measure_cfg):
+		'''
+		Fills in results of a measure for several snapshots at once.
+		measure_data is an iterable of (snapshot_id,value_vec,projid_vec).
+		Snapshots for which the measure is already filled in are skipped.
+		'''
+		measure_id = self.get_measure_id(measure,**measure_cfg)
 
-		if self.cursor.fetchone() is not None:
-			logger.info('Measure {} for snapshot {} already filled in'.format(measure,snapshot_id))
+		if self.db_type == 'postgres':
+			self.cursor.execute('SELECT snapshot_id FROM computed_measures WHERE measure_id=%s;',(measure_id,))
 		else:
+			self.cursor.execute('SELECT snapshot_id FROM computed_measures WHERE measure_id=?;',(measure_id,))
+		already_computed = set(r[0] for r in self.cursor.fetchall())
+
+		snapids = []
+		measure_ids = []
+		snapshot_ids = []
+		project_ids = []
+		values = []
+		for snapshot_id,value_vec,projid_vec in measure_data:
+			if snapshot_id in already_computed:
+				logger.info('Measure {} for snapshot {} already filled in'.format(measure,snapshot_id))
+				continue
+			already_computed.add(snapshot_id)
 			logger.info('Filling in measure {} for snapshot {}'.format(measure,snapshot_id))
+			projid_vec = np.asarray(projid_vec,dtype=np.int64)
+			snapids.append(snapshot_id)
+			measure_ids.append(np.full(len(projid_vec),measure_id,dtype=np.int64))
+			snapshot_ids.append(np.full(len(projid_vec),snapshot_id,dtype=np.int64))
+			project_ids.append(projid_vec)
+			values.append(np.asarray(value_vec,dtype=np.float64))
 
-			if self.db_type == 'postgres':
-				self.cursor.execute('INSERT INTO computed_measures(measure_id,snapshot_id) VALUES(%s,%s);',(measure_id,snapshot_id))
-			else:
-				self.cursor.execute('INSERT INTO computed_measures(measure_id,snapshot_id) VALUES(?,?);',(measure_id,snapshot_id))
-
-			if self.db_type == 'postgres':
-				extras.execute_batch(self.cursor,'INSERT INTO measures(measure_id,snapshot_id,project_id,value) VALUES(%s,%s,%s,%s);',((measure_id,snapshot_id,p_id,val) for p_id,val in zip(projid_vec,value_vec)))
-			else:
-				self.cursor.executemany('INSERT INTO measures(measure_id,snapshot_id,project_id,value) VALUES(?,?,?,?);',((measure_id,snapshot_id,p_id,val) for p_id,val in zip(projid_vec,value_vec)))
+		if len(snapids):
+			self.bulk_insert('computed_measures',('measure_id','snapshot_id'),(np.full(len(snapids),measure_id,dtype=np.int64),np.asarray(snapids,dtype=np.int64)))
+			self.bulk_insert('measures',('measure_id','snapshot_id','project_id','value'),(np.concatenate(measure_ids),np.concatenate(snapshot_ids),np.concatenate(project_ids),np.concatenate(values)))
 
-			self.connection.commit()
-			logger.info('Filled in measure {} for snapshot {}'.format(measure,snapshot_id))
+			if commit:
+				self.connection.commit()
+			logger.info('Filled in measure {} for snapshots {}'.format(measure,snapids))
 
 
 	def fill_exact_comp(self,snapshot_id,source_id,value_vec,projid_vec,commit=True,**sim_cfg):
@@ -1420,38 +1941,42 @@ class Database(object):
 		Fills in results of an exact proba distrib computation
 		TODO: autocomplete cfg
 		'''
+		self.fill_exact_comp_bulk(snapshot_id=snapshot_id,source_ids=[source_id],value_mat=np.asarray(value_vec).reshape((1,-1)),projid_vec=projid_vec,commit=commit,**sim_cfg)
+
+	def fill_exact_comp_bulk(self,snapshot_id,source_ids,value_mat,projid_vec,commit=True,**sim_cfg):
+		'''
+		Fills in results of exact proba distrib computations for several sources at once.
+		value_mat[i,j] is the probability of failure of projid_vec[j] when source_ids[i] fails, as a dense array or a sparse matrix.
+		Zero entries are not stored.
+		'''
+		cfg_id = self.get_cfg_id(sim_cfg)
 		if self.db_type == 'postgres':
-			self.cursor.execute('INSERT INTO exact_computation(snapshot_id,cfg) VALUES(%s,%s) ON CONFLICT DO NOTHING;',(snapshot_id,json.dumps(sim_cfg, indent=None, sort_keys=True)))
-			self.cursor.execute('SELECT id FROM exact_computation WHERE snapshot_id=%s AND cfg=%s;',(snapshot_id,json.dumps(sim_cfg, indent=None, sort_keys=True)))
+			self.cursor.execute('INSERT INTO exact_computation(snapshot_id,cfg_id) VALUES(%s,%s) ON CONFLICT DO NOTHING;',(snapshot_id,cfg_id))
+			self.cursor.execute('SELECT id FROM exact_computation WHERE snapshot_id=%s AND cfg_id=%s;',(snapshot_id,cfg_id))
 		else:
-			self.cursor.execute('INSERT OR IGNORE INTO exact_computation(snapshot_id,cfg) VALUES(?,?);',(snapshot_id,json.dumps(sim_cfg, indent=None, sort_keys=True)))
-			self.cursor.execute('SELECT id FROM exact_computation WHERE snapshot_id=? AND cfg=?;',(snapshot_id,json.dumps(sim_cfg, indent=None, sort_keys=True)))
+			self.cursor.execute('INSERT OR IGNORE INTO exact_computation(snapshot_id,cfg_id) VALUES(?,?);',(snapshot_id,cfg_id))
+			self.cursor.execute('SELECT id FROM exact_computation WHERE snapshot_id=? AND cfg_id=?;',(snapshot_id,cfg_id))
 
 		excomp_id = self.cursor.fetchone()[0]
 
-		# if self.db_type == 'postgres':
-		# 	self.cursor.execute('SELECT * FROM  computed_measures WHERE measure_id=%s AND snapshot_id=%s;',(measure_id,snapshot_id))
-		# else:
-		# 	self.cursor.execute('SELECT * FROM  computed_measures WHERE measure_id=? AND snapshot_id=?;',(measure_id,snapshot_id))
+		source_ids = np.asarray(source_ids,dtype=np.int64)
+		projid_vec = np.asarray(projid_vec,dtype=np.int64)
+		logger.info('Filling in proba distrib for snapshot {} for {} source_ids'.format(snapshot_id,len(source_ids)))
 
-		if self.cursor.fetchone() is not None:
-			logger.info('Proba distrib for snapshot {} for source_id already filled in'.format(snapshot_id,source_id))
+		if scipy.sparse.issparse(value_mat):
+			value_mat = value_mat.tocoo()
+			mask = value_mat.data != 0
+			rows,cols,vals = value_mat.row[mask],value_mat.col[mask],value_mat.data[mask]
 		else:
-			logger.info('Filling in proba distrib for snapshot {} for source_id {}'.format(snapshot_id,source_id))
-
-			# if self.db_type == 'postgres':
-			# 	self.cursor.execute('INSERT INTO computed_measures(measure_id,snapshot_id) VALUES(%s,%s);',(measure_id,snapshot_id))
-			# else:
-			# 	self.cursor.execute('INSERT INTO computed_measures(measure_id,snapshot_id) VALUES(?,?);',(measure_id,snapshot_id))
+			value_mat = np.asarray(value_mat)
+			rows,cols = np.nonzero(value_mat)
+			vals = value_mat[rows,cols]
 
-			if self.db_type == 'postgres':
-				extras.execute_batch(self.cursor,'INSERT INTO exact_computation_values(exact_comp_id,source_id,target_id,proba_value) VALUES(%s,%s,%s,%s);',((excomp_id,source_id,p_id,val) for p_id,val in zip(projid_vec,value_vec) if val!=0))
-			else:
-				self.cursor.executemany('INSERT INTO exact_computation_values(exact_comp_id,source_id,target_id,proba_value) VALUES(?,?,?,?);',((excomp_id,source_id,p_id,val) for p_id,val in zip(projid_vec,value_vec) if val!=0))
+		self.bulk_insert('exact_computation_values',('exact_comp_id','source_id','target_id','proba_value'),(np.full(len(vals),excomp_id,dtype=np.int64),source_ids[rows],projid_vec[cols],np.asarray(vals,dtype=np.float64)))
 
-			if commit:
-				self.connection.commit()
-			logger.info('Filled in proba_distrib for snapshot {} for source_id {}'.format(snapshot_id,source_id))
+		if commit:
+			self.connection.commit()
+		logger.info('Filled in proba_distrib for snapshot {} for {} source_ids'.format(snapshot_id,len(source_ids)))
 
 
 
@@ -1459,20 +1984,23 @@ class Database(object):
 		'''
 		Check if a measure has already been computed, returns bool
 		'''
+		cfg_id = self.get_cfg_id(measure_cfg,create=False)
+		if cfg_id is None:
+			return False
 		if self.db_type == 'postgres':
 			self.cursor.execute('''SELECT * FROM computed_measures cm
 									INNER JOIN measure_types mt
 									ON cm.snapshot_id=%s AND mt.id=cm.measure_id
-									AND mt.name=%s AND mt.cfg=%s
+									AND mt.name=%s AND mt.cfg_id=%s
 									LIMIT 1
-								;''',(snapshot_id,measure,json.dumps(measure_cfg, indent=None, sort_keys=True)))
+								;''',(snapshot_id,measure,cfg_id))
 		else:
 			self.cursor.execute('''SELECT * FROM computed_measures cm
 									INNER JOIN measure_types mt
 									ON cm.snapshot_id=? AND mt.id=cm.measure_id
-									AND mt.name=? AND mt.cfg=?
+									AND mt.name=? AND mt.cfg_id=?
 									LIMIT 1
-								;''',(snapshot_id,measure,json.dumps(measure_cfg, indent=None, sort_keys=True)))
+								;''',(snapshot_id,measure,cfg_id))
 		ans = self.cursor.fetchone()
 		if ans is not None:
 			return True
@@ -1483,16 +2011,19 @@ class Database(object):
 		'''
 		Check if a proba_distrib has already been computed, returns bool
 		'''
+		cfg_id = self.get_cfg_id(cfg,create=False)
+		if cfg_id is None:
+			return False
 		if self.db_type == 'postgres':
 			self.cursor.execute('''SELECT * FROM exact_computation
-									WHERE snapshot_id=%s AND cfg=%s
+									WHERE snapshot_id=%s AND cfg_id=%s
 									LIMIT 1
-								;''',(snapshot_id,json.dumps(cfg, indent=None, sort_keys=True)))
+								;''',(snapshot_id,cfg_id))
 		else:
 			self.cursor.execute('''SELECT * FROM exact_computation
-									WHERE snapshot_id=? AND cfg=?
+									WHERE snapshot_id=? AND cfg_id=?
 									LIMIT 1
-								;''',(snapshot_id,json.dumps(cfg, indent=None, sort_keys=True)))
+								;''',(snapshot_id,cfg_id))
 		ans = self.cursor.fetchone()
 		if ans is not None:
 			return True
@@ -1,8 +1,12 @@
 from .database import Database
 from .simulations import Simulation
+from . import simulations
 from . import measures
+from . import utils
 
+import os
 import json
+import multiprocessing
 import logging
 import numpy as np
 import copy
@@ -10,6 +14,8 @@ import copy
 import  scipy.sparse
 from matplotlib import pyplot as plt
 import matplotlib.dates as mdates
+import matplotlib.figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
 logger = logging.getLogger(__name__)
 ch = logging.StreamHandler()
@@ -31,6 +37,7 @@ class ExperimentManager(object):
 			self.db = db
 		else:
 			self.db = Database(**kwargs)
+		self.measure_matrix_cache = {}
 
 	def list_snapshots(self):
 		'''
@@ -63,31 +70,34 @@ class ExperimentManager(object):
 		else:
 			str_nb_sim = str(max_size)+' '
 		logger.info('Listing {}simulations for snapshot_id {}, failing_project id {}'.format(str_nb_sim,snapid,failing_project))
+		sim_cfg_id = self.db.get_cfg_id(sim_cfg,create=False)
+		if sim_cfg_id is None:
+			return []
 		if failing_project is not None:
 			if self.db.db_type == 'postgres':
 				self.db.cursor.execute(''' SELECT id, executed, failing_project FROM simulations
 					WHERE snapshot_id = %s
 						AND failing_project = %s
-						AND sim_cfg = %s
+						AND sim_cfg_id = %s
 					ORDER BY executed,id
 					LIMIT %s
-					;''',(snapshot_id,failing_project,json.dumps(sim_cfg, indent=None, sort_keys=True),max_size))
+					;''',(snapid,failing_project,sim_cfg_id,max_size))
 			else:
 				if max_size is None:
 					self.db.cursor.execute(''' SELECT id, executed, failing_project FROM simulations
 						WHERE snapshot_id = ?
 							AND failing_project = ?
-						AND sim_cfg = ?
+						AND sim_cfg_id = ?
 						ORDER BY executed,id
-						;''',(snapshot_id,failing_project,json.dumps(sim_cfg, indent=None, sort_keys=True)))
+						;''',(snapid,failing_project,sim_cfg_id))
 				else:
 					self.db.cursor.execute(''' SELECT id, executed, failing_project FROM simulations
 						WHERE snapshot_id = ?
 							AND failing_project = ?
-						AND sim_cfg = ?
+						AND sim_cfg_id = ?
 						ORDER BY executed,id
 						LIMIT ?
-						;''',(snapshot_id,failing_project,json.dumps(sim_cfg, indent=None, sort_keys=True),max_size))
+						;''',(snapid,failing_project,sim_cfg_id,max_size))
 		else:
 			if self.db.db_type == 'postgres':
 				self.db.cursor.execute('''
@@ -95,18 +105,18 @@ class ExperimentManager(object):
 				 JOIN LATERAL (SELECT s.id, s.executed FROM simulations s
 					WHERE s.snapshot_id = %s
 						AND s.failing_project = p.id
-						AND s.sim_cfg = %s
+						AND s.sim_cfg_id = %s
 					ORDER BY s.executed,s.id
 					LIMIT %s) AS ss ON TRUE
 					ORDER BY ss.executed,ss.id
-					;''',(snapshot_id,json.dumps(sim_cfg, indent=None, sort_keys=True),max_size))
+					;''',(snapid,sim_cfg_id,max_size))
 			else:
 				if max_size is None:
 					self.db.cursor.execute(''' SELECT id, executed, failing_project FROM simulations
 						WHERE snapshot_id = ?
-						AND sim_cfg = ?
+						AND sim_cfg_id = ?
 						ORDER BY executed,id
-						;''',(snapshot_id,json.dumps(sim_cfg, indent=None, sort_keys=True)))
+						;''',(snapid,sim_cfg_id))
 				else:
 					self.db.cursor.execute('''
 						SELECT s1.id,s1.executed,s1.failing_project FROM projects p
@@ -114,12 +124,12 @@ class ExperimentManager(object):
 								ON s1.id IN
 									(SELECT s2.id FROM simulations s2
 										WHERE s2.snapshot_id = ?
-										AND s2.sim_cfg = ?
+										AND s2.sim_cfg_id = ?
 										AND s2.failing_project = p.id
 										ORDER BY s2.executed,s2.id
 										LIMIT ?)
 								ORDER BY s1.executed,s1.id
-						;''',(snapshot_id,json.dumps(sim_cfg, indent=None, sort_keys=True),max_size))
+						;''',(snapid,sim_cfg_id,max_size))
 
 		return list(self.db.cursor.fetchall())
 
@@ -172,23 +182,114 @@ class ExperimentManager(object):
 					self.db.register_simulation(sim,commit=commit)
 
 
-	def run_single_simulation(self,simulation_id,network=None,commit=True):
+	def run_single_simulation(self,simulation_id,network=None,snapshot_id=None,bootstrap_sim=None,commit=True):
 		'''
 		Runs a single simulation, used in run_simulations
 		'''
 
 		if self.db.db_type == 'postgres':
-			self.db.cursor.execute('SELECT sim_cfg,snapshot_id,failing_project,random_seed FROM simulations WHERE id=%s;',(simulation_id,))
+			self.db.cursor.execute('SELECT sim_cfg_id,snapshot_id,failing_project,random_seed FROM simulations WHERE id=%s;',(simulation_id,))
 		else:
-			self.db.cursor.execute('SELECT sim_cfg,snapshot_id,failing_project,random_seed FROM simulations WHERE id=?;',(simulation_id,))
+			self.db.cursor.execute('SELECT sim_cfg_id,snapshot_id,failing_project,random_seed FROM simulations WHERE id=?;',(simulation_id,))
 
+		sim_cfg_id,snapshot_id,failing,random_seed = self.db.cursor.fetchone()
+		sim_cfg = self.db.get_cfg(sim_cfg_id)
 		if network is None:
 			network = self.db.get_network(snapshot_id=snapshot_id)
-		sim_cfg,snapshot_id,failing,random_seed = self.db.cursor.fetchone()
-		sim = Simulation(network=network,snapshot_id=snapshot_id,failing_project=failing,random_seed=random_seed,**sim_cfg)
+		sim = Simulation(network=network,snapshot_id=snapshot_id,failing_project=failing,random_seed=random_seed,bootstrap_sim=bootstrap_sim,**sim_cfg)
 		sim.run()
 		self.db.register_simulation(sim,commit=commit)
 
+	def run_simulations_series(self,snapshot_ids=None,full_network=False,nb_sim=100,**sim_cfg):
+		'''
+		Runs simulations for all projects as source of failure on a series of snapshots (all snapshots by default), with the crn implementation and random seeds 0 to nb_sim-1.
+		Snapshots are processed by increasing time. Thanks to common random numbers, cascades that cannot reach a modified part of the network are identical to the ones of the previous snapshot:
+		their results are copied instead of being simulated again.
+		'''
+		sim_cfg = Simulation.complete_sim_cfg(**sim_cfg)
+		sim_cfg['implementation'] = 'crn'
+		sim_cfg_id = self.db.get_cfg_id(sim_cfg)
+
+		if self.db.db_type == 'postgres':
+			self.db.cursor.execute('SELECT id FROM snapshots WHERE full_network=%s ORDER BY snapshot_time;',(full_network,))
+		else:
+			self.db.cursor.execute('SELECT id FROM snapshots WHERE full_network=? ORDER BY snapshot_time;',(full_network,))
+		snapid_list = [r[0] for r in self.db.cursor.fetchall()]
+		if snapshot_ids is not None:
+			snapid_list = [snapid for snapid in snapid_list if snapid in snapshot_ids]
+
+		all_seeds = set(range(nb_sim))
+		prev_snapid = None
+		for snapid in snapid_list:
+			edges,nodes = self.db.get_network_arrays(snapshot_id=snapid)
+			seeds = self.executed_seeds(snapshot_id=snapid,sim_cfg_id=sim_cfg_id)
+
+			reused = []
+			if prev_snapid is not None:
+				invalid = simulations.invalidated_sources(prev_edges=prev_edges,prev_nodes=prev_nodes,edges=edges,nodes=nodes,norm_exponent=sim_cfg['norm_exponent'])
+				candidates = np.setdiff1d(nodes,invalid)
+				reused = [fp for fp in candidates.tolist() if fp not in seeds and prev_seeds.get(fp) == all_seeds]
+				self.db.copy_simulations(from_snapshot_id=prev_snapid,to_snapshot_id=snapid,sim_cfg_id=sim_cfg_id,failing_projects=reused,commit=False)
+				for fp in reused:
+					seeds[fp] = set(all_seeds)
+
+			to_run = [fp for fp in nodes.tolist() if not all_seeds.issubset(seeds.get(fp,set()))]
+			if len(to_run):
+				network = self.db.get_network(snapshot_id=snapid)
+				bootstrap_sim = Simulation(network=network,failing_project=None,snapshot_id=snapid,**sim_cfg)
+				for fp in to_run:
+					for seed in sorted(all_seeds - seeds.get(fp,set())):
+						sim = Simulation(network=network,snapshot_id=snapid,failing_project=fp,random_seed=seed,bootstrap_sim=bootstrap_sim,**sim_cfg)
+						sim.run()
+						self.db.register_simulation(sim,commit=False)
+					seeds.setdefault(fp,set()).update(all_seeds)
+			self.db.connection.commit()
+			logger.info('Snapshot {}: results of {} sources copied from previous snapshot, {} sources simulated'.format(snapid,len(reused),len(to_run)))
+			prev_snapid,prev_edges,prev_nodes,prev_seeds = snapid,edges,nodes,seeds
+
+	def run_simulations_grid(self,propag_proba_list,failing_project=None,snapshot_id=None,snapshot_time=None,full_network=False,nb_sim=100,**sim_cfg):
+		'''
+		Runs simulations for several values of propag_proba in one pass, with the crn implementation and random seeds 0 to nb_sim-1.
+		Each run is computed once for all values (see Simulation.run_grid) and registered under the sim_cfg of each value.
+		Runs already executed for a value are skipped.
+		'''
+		snapid = self.db.get_snapshot_id(snapshot_id=snapshot_id,snapshot_time=snapshot_time,full_network=full_network,create=True)
+		sim_cfg = Simulation.complete_sim_cfg(**sim_cfg)
+		sim_cfg['implementation'] = 'crn'
+		propag_proba_list = list(propag_proba_list)
+		seeds_list = [self.executed_seeds(snapshot_id=snapid,sim_cfg_id=self.db.get_cfg_id(dict(sim_cfg,propag_proba=propag_proba))) for propag_proba in propag_proba_list]
+
+		if failing_project is None:
+			id_list = self.db.get_nodes(snapshot_id=snapid)
+		else:
+			id_list = [failing_project]
+		network = None
+		for p_id in id_list:
+			for seed in range(nb_sim):
+				missing = [k for k,seeds in enumerate(seeds_list) if seed not in seeds.get(p_id,set())]
+				if not len(missing):
+					continue
+				if network is None:
+					network = self.db.get_network(snapshot_id=snapid)
+					bootstrap_sim = Simulation(network=network,failing_project=None,snapshot_id=snapid,**sim_cfg)
+				sim = Simulation(network=network,snapshot_id=snapid,failing_project=p_id,random_seed=seed,bootstrap_sim=bootstrap_sim,**sim_cfg)
+				for grid_sim in sim.run_grid(propag_proba_list=[propag_proba_list[k] for k in missing]):
+					self.db.register_simulation(grid_sim,commit=False)
+			self.db.connection.commit()
+
+	def executed_seeds(self,snapshot_id,sim_cfg_id):
+		'''
+		Returns a dict {failing_project: set of random seeds} of the executed simulations of a snapshot and configuration
+		'''
+		if self.db.db_type == 'postgres':
+			self.db.cursor.execute('SELECT failing_project,random_seed FROM simulations WHERE snapshot_id=%s AND sim_cfg_id=%s AND executed;',(snapshot_id,sim_cfg_id))
+		else:
+			self.db.cursor.execute('SELECT failing_project,random_seed FROM simulations WHERE snapshot_id=? AND sim_cfg_id=? AND executed;',(snapshot_id,sim_cfg_id))
+		seeds = {}
+		for fp,seed in self.db.cursor.fetchall():
+			seeds.setdefault(fp,set()).add(seed)
+		return seeds
+
 	def get_id_vector(self,snapshot_id):
 		'''
 		returns a vector of the ordered IDs
@@ -197,6 +298,75 @@ class ExperimentManager(object):
 
 		return np.asarray(sorted(self.db.get_nodes(snapshot_id=snapshot_id)))
 
+	def selected_simulations(self,snapshot_id,nb_sim,failing_project=None,**sim_cfg):
+		'''
+		Returns a SQL subquery and its parameters, selecting for each source project the first nb_sim executed simulations (by id) of the snapshot and configuration.
+		Columns are id, failing_project and sim_rank (0 to nb_sim-1, position of the simulation among the ones of its source).
+		Restricted to one source project if failing_project is not None.
+
+		Used as a derived table in result queries, so that selection, joins and aggregation happen in a single statement.
+		'''
+		sim_cfg = Simulation.complete_sim_cfg(**sim_cfg)
+		sim_cfg_id = self.db.get_cfg_id(sim_cfg,create=False)
+		if self.db.db_type == 'postgres':
+			placeholder = '%s'
+		else:
+			placeholder = '?'
+		if failing_project is None:
+			fp_filter = ''
+			params = (snapshot_id,sim_cfg_id,nb_sim)
+		else:
+			fp_filter = 'AND failing_project={}'.format(placeholder)
+			params = (snapshot_id,sim_cfg_id,failing_project,nb_sim)
+		query = '''(SELECT id,failing_project,sim_rank FROM
+					(SELECT id,failing_project,ROW_NUMBER() OVER (PARTITION BY failing_project ORDER BY id)-1 AS sim_rank
+						FROM simulations
+						WHERE snapshot_id={ph} AND sim_cfg_id={ph} {fp_filter} AND executed
+					) ranked_sims
+				WHERE sim_rank<{ph})'''.format(ph=placeholder,fp_filter=fp_filter)
+		return query,params
+
+	def check_nb_simulations(self,snapshot_id,nb_sim,nb_sources,failing_project=None,**sim_cfg):
+		'''
+		Raises an error if less than nb_sim executed simulations are available for each of the nb_sources source projects
+		'''
+		sel_query,sel_params = self.selected_simulations(snapshot_id=snapshot_id,nb_sim=nb_sim,failing_project=failing_project,**sim_cfg)
+		self.db.cursor.execute('SELECT COUNT(*) FROM {} ss;'.format(sel_query),sel_params)
+		nb_found = self.db.cursor.fetchone()[0]
+		if nb_found<nb_sim*nb_sources:
+			raise Exception('Not enough simulations, {}x{}={} expected, {} found.'.format(nb_sim,nb_sources,nb_sim*nb_sources,nb_found))
+
+	def aggregates_available(self,snapshot_id,nb_sim,nb_sources,failing_project=None,**sim_cfg):
+		'''
+		Checks whether the aggregate tables sim_agg and sim_agg_failing can be used instead of scanning simulation_results:
+		each of the nb_sources source projects (or only failing_project if not None) must have exactly nb_sim executed runs,
+		so that the aggregates cover the same simulations as the ones selected by selected_simulations.
+		'''
+		sim_cfg = Simulation.complete_sim_cfg(**sim_cfg)
+		sim_cfg_id = self.db.get_cfg_id(sim_cfg,create=False)
+		if sim_cfg_id is None:
+			return False
+		if self.db.db_type == 'postgres':
+			if failing_project is None:
+				self.db.cursor.execute('''SELECT COUNT(*),MIN(nb_runs),MAX(nb_runs) FROM sim_agg
+						WHERE snapshot_id=%s AND sim_cfg_id=%s
+					;''',(snapshot_id,sim_cfg_id))
+			else:
+				self.db.cursor.execute('''SELECT COUNT(*),MIN(nb_runs),MAX(nb_runs) FROM sim_agg
+						WHERE snapshot_id=%s AND sim_cfg_id=%s AND failing_project=%s
+					;''',(snapshot_id,sim_cfg_id,failing_project))
+		else:
+			if failing_project is None:
+				self.db.cursor.execute('''SELECT COUNT(*),MIN(nb_runs),MAX(nb_runs) FROM sim_agg
+						WHERE snapshot_id=? AND sim_cfg_id=?
+					;''',(snapshot_id,sim_cfg_id))
+			else:
+				self.db.cursor.execute('''SELECT COUNT(*),MIN(nb_runs),MAX(nb_runs) FROM sim_agg
+						WHERE snapshot_id=? AND sim_cfg_id=? AND failing_project=?
+					;''',(snapshot_id,sim_cfg_id,failing_project))
+		nb_found,min_runs,max_runs = self.db.cursor.fetchone()
+		return nb_found == nb_sources and min_runs == nb_sim and max_runs == nb_sim
+
 	def get_results(self,snapshot_id=None,snapshot_time=None,full_network=False,nb_sim=100,failing_project=None,result_type='counts',aggregated=False,**sim_cfg):
 		'''
 		Batch getting the results of the simulations.
@@ -204,110 +374,65 @@ class ExperimentManager(object):
 		Alternatively output could be a pandas dataframe?
 		'''
 		snapid = self.db.get_snapshot_id(snapshot_id=snapshot_id,snapshot_time=snapshot_time,full_network=full_network,create=True)
-		id_vec = self.get_id_vector(snapshot_id=snapid)
-
-		index_reverse = {n:i for i,n in enumerate(id_vec)}
-
-		query_results = None # for combining chunks of queries, SQLite does not accept >999 variables per query
 
 		if failing_project is None:
 			return self.get_results_full(snapshot_id=snapid,nb_sim=nb_sim,result_type=result_type,aggregated=aggregated,**sim_cfg)
 		else:
-			# self.run_simulations(snapshot_id=snapid,nb_sim=nb_sim,failing_project=failing_project,**sim_cfg)  # redundancy with later list_simulations, but necessary to avoid measure computation when no simu available
-			sim_list = self.list_simulations(failing_project=failing_project,snapshot_id=snapid,max_size=nb_sim,**sim_cfg)
-			if len(sim_list)<nb_sim*1:
-				raise Exception('Not enough simulations, {}x{}={} expected, {} found.'.format(nb_sim,1,nb_sim*1,len(sim_list)))
+			id_vec = self.get_id_vector(snapshot_id=snapid)
+
+			if result_type == 'counts' and self.aggregates_available(snapshot_id=snapid,nb_sim=nb_sim,nb_sources=1,failing_project=failing_project,**sim_cfg):
+				sim_cfg_id = self.db.get_cfg_id(Simulation.complete_sim_cfg(**sim_cfg),create=False)
+				if self.db.db_type == 'postgres':
+					self.db.cursor.execute('''SELECT nb_failing,failing FROM sim_agg_failing
+							WHERE snapshot_id=%s AND sim_cfg_id=%s AND failing_project=%s
+						;''',(snapid,sim_cfg_id,failing_project))
+				else:
+					self.db.cursor.execute('''SELECT nb_failing,failing FROM sim_agg_failing
+							WHERE snapshot_id=? AND sim_cfg_id=? AND failing_project=?
+						;''',(snapid,sim_cfg_id,failing_project))
+				vals,fps = utils.rows_to_arrays(self.db.cursor.fetchall(),2)
+				results = np.zeros((len(id_vec),))
+				results[utils.ids_to_indices(id_vec,fps)] = vals
+				return results
+
+			self.check_nb_simulations(snapshot_id=snapid,nb_sim=nb_sim,nb_sources=1,failing_project=failing_project,**sim_cfg)
+			sel_query,sel_params = self.selected_simulations(snapshot_id=snapid,nb_sim=nb_sim,failing_project=failing_project,**sim_cfg)
 
-			# if len(sim_list) == 0:
-			# 	raise ValueError('No simulations found')
-			sim_id_list = sorted([s_id for s_id,exec_status,fp in sim_list])
-			reverse_sim_index = {s:i for i,s in enumerate(sim_id_list)}
 			#### RAW  returns sparse_mat[project,sim]=np.bool
 			if result_type == 'raw':
-				if self.db.db_type =='postgres':
-					self.db.cursor.execute('''
-						SELECT simulation_id,failing FROM simulation_results
-							WHERE simulation_id IN %s
-							ORDER BY simulation_id,failing
-						;''',(tuple(sim_id_list),))
-				else:
-					sim_id_list_temp = copy.deepcopy(sim_id_list)
-					query_results = []
-					while len(sim_id_list_temp)>0:
-						sim_id_list_chunk = sim_id_list_temp[:999]
-						del sim_id_list_temp[:999]
-						self.db.cursor.execute('''
-							SELECT simulation_id,failing FROM simulation_results
-								WHERE simulation_id IN ({})
-								ORDER BY simulation_id,failing
-							;'''.format(','.join(['?' for _ in sim_id_list_chunk])),sim_id_list_chunk)
-						query_results += list(self.db.cursor.fetchall())
-
-
-				if query_results is None:
-					query_results = list(self.db.cursor.fetchall())
-
-				results_data = [(index_reverse[fp],reverse_sim_index[s_id],True) for s_id,fp in query_results]
-				results_v = np.asarray([r[2] for r in results_data])
-				results_i = np.asarray([r[0] for r in results_data])
-				results_j = np.asarray([r[1] for r in results_data])
-				results_ijv = (results_v,(results_i,results_j))
-				results = scipy.sparse.coo_matrix(results_ijv,shape=(len(id_vec),nb_sim),dtype=np.bool).tocsr()
+				self.db.cursor.execute('''
+					SELECT ss.sim_rank,sr.failing FROM {} ss
+						INNER JOIN simulation_results sr
+						ON sr.simulation_id=ss.id
+					;'''.format(sel_query),sel_params)
+				sim_ranks,fps = utils.rows_to_arrays(self.db.cursor.fetchall(),2)
+				results_ijv = (np.ones(len(fps),dtype=bool),(utils.ids_to_indices(id_vec,fps),sim_ranks))
+				results = scipy.sparse.coo_matrix(results_ijv,shape=(len(id_vec),nb_sim),dtype=bool).tocsr()
 				return results
 
 			#### COUNTS   returns nparray[project]
 			elif result_type == 'counts':
-				if self.db.db_type =='postgres':
-					self.db.cursor.execute('''
-						SELECT COUNT(*),failing FROM simulation_results
-							WHERE simulation_id IN %s
-							GROUP BY failing
-						;''',(tuple(sim_id_list),))
-				else:
-					sim_id_list_temp = copy.deepcopy(sim_id_list)
-					query_results = []
-					while len(sim_id_list_temp)>0:
-						sim_id_list_chunk = sim_id_list_temp[:999]
-						del sim_id_list_temp[:999]
-						self.db.cursor.execute('''
-							SELECT COUNT(*),failing FROM simulation_results
-								WHERE simulation_id IN ({})
-								GROUP BY failing
-							;'''.format(','.join(['?' for _ in sim_id_list_chunk])),sim_id_list_chunk)
-						query_results += list(self.db.cursor.fetchall())
-
-				if query_results is None:
-					query_results = list(self.db.cursor.fetchall())
+				self.db.cursor.execute('''
+					SELECT COUNT(*),sr.failing FROM {} ss
+						INNER JOIN simulation_results sr
+						ON sr.simulation_id=ss.id
+						GROUP BY sr.failing
+					;'''.format(sel_query),sel_params)
+				vals,fps = utils.rows_to_arrays(self.db.cursor.fetchall(),2)
 				results = np.zeros((len(id_vec),))
-				for val,fp in query_results:
-					results[index_reverse[fp]] = val
+				results[utils.ids_to_indices(id_vec,fps)] = vals
 				return results
 			#### NB FAILING   returns nparray[sim]
 			elif result_type == 'nb_failing':
-				if self.db.db_type =='postgres':
-					self.db.cursor.execute('''
-						SELECT COUNT(*),simulation_id FROM simulation_results
-							WHERE simulation_id IN %s
-							GROUP BY simulation_id
-						;''',(tuple(sim_id_list),))
-				else:
-					sim_id_list_temp = copy.deepcopy(sim_id_list)
-					query_results = []
-					while len(sim_id_list_temp)>0:
-						sim_id_list_chunk = sim_id_list_temp[:999]
-						del sim_id_list_temp[:999]
-						self.db.cursor.execute('''
-							SELECT COUNT(*),simulation_id FROM simulation_results
-								WHERE simulation_id IN ({})
-								GROUP BY simulation_id
-							;'''.format(','.join(['?' for _ in sim_id_list_chunk])),sim_id_list_chunk)
-						query_results += list(self.db.cursor.fetchall())
-
-				results = np.zeros((len(sim_id_list),))
-				if query_results is None:
-					query_results = list(self.db.cursor.fetchall())
-				for val,s_id in query_results: #using query_results and not cursor.fetchall() to allow for chunked queries in sqlite. Not more than 999 variables allowed per query
-					results[reverse_sim_index[s_id]] = val
+				self.db.cursor.execute('''
+					SELECT COUNT(*),ss.sim_rank FROM {} ss
+						INNER JOIN simulation_results sr
+						ON sr.simulation_id=ss.id
+						GROUP BY ss.sim_rank
+					;'''.format(sel_query),sel_params)
+				vals,sim_ranks = utils.rows_to_arrays(self.db.cursor.fetchall(),2)
+				results = np.zeros((nb_sim,))
+				results[sim_ranks] = vals
 				return results
 			else:
 				raise ValueError('Unknown result_type: {}'.format(result_type))
@@ -319,158 +444,204 @@ class ExperimentManager(object):
 		snapid = self.db.get_snapshot_id(snapshot_id=snapshot_id,snapshot_time=snapshot_time,full_network=full_network,create=True)
 		id_vec = self.get_id_vector(snapshot_id=snapid)
 
-		index_reverse = {n:i for i,n in enumerate(id_vec)}
-
-		# self.run_simulations(snapshot_id=snapid,nb_sim=nb_sim,**sim_cfg) # redundancy with later list_simulations, but necessary to avoid measure computation when no simu available
-
-		# sim_list = []
-		# for n in id_vec:
-		# 	sim_list += self.list_simulations(failing_project=int(n),snapshot_id=snapid,max_size=nb_sim,**sim_cfg)
-		sim_list = self.list_simulations(failing_project=None,snapshot_id=snapid,max_size=nb_sim,**sim_cfg)
-		if len(sim_list)<nb_sim*len(id_vec):
-			raise Exception('Not enough simulations, {}x{}={} expected, {} found.'.format(nb_sim,len(id_vec),nb_sim*len(id_vec),len(sim_list)))
-
-		sim_id_list = sorted([s_id for s_id,exec_status,fp in sim_list])
-		reverse_sim_index = {s:i for i,s in enumerate(sim_id_list)}
+		if result_type == 'counts' or (result_type == 'nb_failing' and aggregated):
+			if self.aggregates_available(snapshot_id=snapid,nb_sim=nb_sim,nb_sources=len(id_vec),**sim_cfg):
+				return self.get_results_from_aggregates(snapshot_id=snapid,id_vec=id_vec,nb_sim=nb_sim,result_type=result_type,aggregated=aggregated,**sim_cfg)
 
-		query_results = None # for combining chunks of queries, SQLite does not accept >999 variables per query
+		self.check_nb_simulations(snapshot_id=snapid,nb_sim=nb_sim,nb_sources=len(id_vec),**sim_cfg)
+		sel_query,sel_params = self.selected_simulations(snapshot_id=snapid,nb_sim=nb_sim,**sim_cfg)
 
 		#### RAW   returns sparse_mat[project,sim] . along the sim dimension, all of them are here (no failing_project dim), hence a length of nb_sim*nb_projects
+		# column of a simulation: nb_sim*(index of source project) + rank of the simulation for this source
 		if result_type == 'raw':
 			if aggregated:
 				raise ValueError('Aggregated mode is not available for result_type raw')
 			else:
-				if self.db.db_type =='postgres':
-					self.db.cursor.execute('''
-						SELECT sr.simulation_id,sr.failing,s.failing_project FROM simulation_results sr
-							INNER JOIN simulations s
-							ON sr.simulation_id IN %s AND s.id=sr.simulation_id
-							ORDER BY sr.simulation_id,sr.failing
-						;''',(tuple(sim_id_list),))
-				else:
-					sim_id_list_temp = copy.deepcopy(sim_id_list)
-					query_results = []
-					while len(sim_id_list_temp)>0:
-						sim_id_list_chunk = sim_id_list_temp[:999]
-						del sim_id_list_temp[:999]
-						self.db.cursor.execute('''
-							SELECT sr.simulation_id,sr.failing,s.failing_project FROM simulation_results sr
-								INNER JOIN simulations s
-								ON sr.simulation_id IN ({}) AND s.id=sr.simulation_id
-								ORDER BY sr.simulation_id,s.failing_project,sr.failing
-							;'''.format(','.join(['?' for _ in sim_id_list_chunk])),sim_id_list_chunk)
-						query_results += list(self.db.cursor.fetchall())
-
-				if query_results is None:
-					query_results = list(self.db.cursor.fetchall())
-
-				results_data = [(index_reverse[fp],reverse_sim_index[s_id],True) for s_id,fp,orig_fp in query_results]
-				results_v = np.asarray([r[2] for r in results_data])
-				results_i = np.asarray([r[0] for r in results_data])
-				results_j = np.asarray([r[1] for r in results_data])
-				results_ijv = (results_v,(results_i,results_j))
-
-				results = scipy.sparse.coo_matrix(results_ijv,shape=(len(id_vec),nb_sim*len(id_vec)),dtype=np.bool).tocsr()
+				self.db.cursor.execute('''
+					SELECT ss.failing_project,ss.sim_rank,sr.failing FROM {} ss
+						INNER JOIN simulation_results sr
+						ON sr.simulation_id=ss.id
+					;'''.format(sel_query),sel_params)
+
+				orig_fps,sim_ranks,fps = utils.rows_to_arrays(self.db.cursor.fetchall(),3)
+				results_ijv = (np.ones(len(fps),dtype=bool),(utils.ids_to_indices(id_vec,fps),nb_sim*utils.ids_to_indices(id_vec,orig_fps)+sim_ranks))
+
+				results = scipy.sparse.coo_matrix(results_ijv,shape=(len(id_vec),nb_sim*len(id_vec)),dtype=bool).tocsr()
 				return results
 		#### COUNTS   returns sparse_mat[project,orig_failing_project] normalized by nb_sim or nparray[project] aggregated by orig_failing_project and normalized by nb_sim
 		elif result_type == 'counts':
-			if self.db.db_type =='postgres':
-				self.db.cursor.execute('''
-					SELECT sr.failing,s.failing_project,COUNT(*)  FROM simulation_results sr
-						INNER JOIN simulations s
-						ON sr.simulation_id IN %s AND s.id=sr.simulation_id
-						GROUP BY sr.failing,s.failing_project
-						ORDER BY sr.failing,s.failing_project
-					;''',(tuple(sim_id_list),))
-			else:
-				sim_id_list_temp = copy.deepcopy(sim_id_list)
-				query_results = []
-				while len(sim_id_list_temp)>0:
-					sim_id_list_chunk = sim_id_list_temp[:999]
-					del sim_id_list_temp[:999]
-					self.db.cursor.execute('''
-						SELECT sr.failing,s.failing_project,COUNT(*)  FROM simulation_results sr
-							INNER JOIN simulations s
-							ON sr.simulation_id IN ({}) AND s.id=sr.simulation_id
-							GROUP BY sr.failing,s.failing_project
-							ORDER BY sr.failing,s.failing_project
-							;'''.format(','.join(['?' for _ in sim_id_list_chunk])),sim_id_list_chunk)
-					query_results += list(self.db.cursor.fetchall())
-			# results = sparse.coo_matrix((nb_nodes,nb_sim))
-
-			if query_results is None:
-				query_results = list(self.db.cursor.fetchall())
-
 			if aggregated:
+				self.db.cursor.execute('''
+					SELECT sr.failing,COUNT(*) FROM {} ss
+						INNER JOIN simulation_results sr
+						ON sr.simulation_id=ss.id
+						GROUP BY sr.failing
+					;'''.format(sel_query),sel_params)
+				fps,vals = utils.rows_to_arrays(self.db.cursor.fetchall(),2)
 				results = np.zeros((len(id_vec),))
-				for fp,orig_fp,val in self.db.cursor.fetchall():
-					try:
-						results[index_reverse[fp]] += val
-					except:
-						logger.warning(fp)
-						logger.warning(index_reverse)
-						raise
-				results = results/nb_sim # normalization outside of loop (not +=val/nb_sim) to avoid accumulation of rounding errors
+				results[utils.ids_to_indices(id_vec,fps)] = vals
+				results = results/nb_sim
 			else:
 				# as sparse
-
-				results_data = [(index_reverse[fp],index_reverse[orig_fp],val) for fp,orig_fp,val in self.db.cursor.fetchall()]
-				results_v = np.asarray([r[2] for r in results_data])
-				results_i = np.asarray([r[0] for r in results_data])
-				results_j = np.asarray([r[1] for r in results_data])
-				results_ijv = (results_v,(results_i,results_j))
+				self.db.cursor.execute('''
+					SELECT sr.failing,ss.failing_project,COUNT(*) FROM {} ss
+						INNER JOIN simulation_results sr
+						ON sr.simulation_id=ss.id
+						GROUP BY sr.failing,ss.failing_project
+					;'''.format(sel_query),sel_params)
+				fps,orig_fps,vals = utils.rows_to_arrays(self.db.cursor.fetchall(),3)
+				results_ijv = (vals,(utils.ids_to_indices(id_vec,fps),utils.ids_to_indices(id_vec,orig_fps)))
 
 				results = scipy.sparse.coo_matrix(results_ijv,shape=(len(id_vec),len(id_vec),),dtype=np.int64).tocsr()/nb_sim
 
 			return results
 		#### NB FAILING   returns sparse_mat[sim,orig_failing_project] or nparray[orig_failing_project] aggregated by sim norm by nb_sim (no norm in non agg case)
 		elif result_type == 'nb_failing':
-			if self.db.db_type =='postgres':
-				self.db.cursor.execute('''
-					SELECT sr.simulation_id,s.failing_project,COUNT(*)  FROM simulation_results sr
-						INNER JOIN simulations s
-						ON sr.simulation_id IN %s AND s.id=sr.simulation_id
-						GROUP BY sr.simulation_id,s.failing_project
-						ORDER BY sr.simulation_id,s.failing_project
-					;''',(tuple(sim_id_list),))
-			else:
-				sim_id_list_temp = copy.deepcopy(sim_id_list)
-				query_results = []
-				while len(sim_id_list_temp)>0:
-					sim_id_list_chunk = sim_id_list_temp[:999]
-					del sim_id_list_temp[:999]
-					self.db.cursor.execute('''
-						SELECT sr.simulation_id,s.failing_project,COUNT(*)  FROM simulation_results sr
-							INNER JOIN simulations s
-							ON sr.simulation_id IN ({}) AND s.id=sr.simulation_id
-							GROUP BY sr.simulation_id,s.failing_project
-							ORDER BY sr.simulation_id,s.failing_project
-							;'''.format(','.join(['?' for _ in sim_id_list_chunk])),sim_id_list_chunk)
-					query_results += list(self.db.cursor.fetchall())
-
-			if query_results is None:
-				query_results = list(self.db.cursor.fetchall())
-
 			if aggregated:
+				self.db.cursor.execute('''
+					SELECT ss.failing_project,COUNT(*) FROM {} ss
+						INNER JOIN simulation_results sr
+						ON sr.simulation_id=ss.id
+						GROUP BY ss.failing_project
+					;'''.format(sel_query),sel_params)
+				orig_fps,vals = utils.rows_to_arrays(self.db.cursor.fetchall(),2)
 				results = np.zeros((len(id_vec),))
-				for s_id,orig_fp,val in query_results:
-					results[index_reverse[orig_fp]] += val
+				results[utils.ids_to_indices(id_vec,orig_fps)] = vals
 				results = results/nb_sim # normalization outside of loop (not +=val/nb_sim) to avoid accumulation of rounding errors
 			else:
-				# as sparse; having to shift sim_id by nb_sim*(orig_fp) to stack simulations by orig_fp
-				results_data = [(reverse_sim_index[s_id]-nb_sim*index_reverse[orig_fp],index_reverse[orig_fp],val) for s_id,orig_fp,val in query_results]
-				results_v = np.asarray([r[2] for r in results_data])
-				results_i = np.asarray([r[0] for r in results_data])
-				results_j = np.asarray([r[1] for r in results_data])
-				results_ijv = (results_v,(results_i,results_j))
+				self.db.cursor.execute('''
+					SELECT ss.sim_rank,ss.failing_project,COUNT(*) FROM {} ss
+						INNER JOIN simulation_results sr
+						ON sr.simulation_id=ss.id
+						GROUP BY ss.id,ss.sim_rank,ss.failing_project
+					;'''.format(sel_query),sel_params)
+				sim_ranks,orig_fps,vals = utils.rows_to_arrays(self.db.cursor.fetchall(),3)
+				results_ijv = (vals,(sim_ranks,utils.ids_to_indices(id_vec,orig_fps)))
 				results = scipy.sparse.coo_matrix(results_ijv,shape=(nb_sim,len(id_vec),)).tocsr()
 			return results
 		else:
 			raise ValueError('Unknown result_type: {}'.format(result_type))
 
-	def compute_measure(self,measure,snapshot_id=None,bootstrap_dict=None,**measure_cfg):
+	def iter_results(self,snapshot_id=None,snapshot_time=None,full_network=False,nb_sim=100,chunk_size=None,fetch_size=10000,**sim_cfg):
+		'''
+		Streaming version of get_results_full(result_type='raw'), keeping memory bounded by the size of one chunk.
+		Columns follow the same order as in get_results_full: nb_sim*(index of source project) + rank of the simulation.
+
+		If chunk_size is None, yields (failing_project,results) for each source project, results being a sparse boolean matrix [project,sim] of shape (nb_projects,nb_sim).
+		Otherwise, yields (first_column,results) for consecutive blocks of chunk_size simulations, results having shape (nb_projects,chunk_size) (less for the last block).
+
+		Rows are fetched fetch_size at a time, on a separate cursor (server-side for postgres).
+		'''
+		snapid = self.db.get_snapshot_id(snapshot_id=snapshot_id,snapshot_time=snapshot_time,full_network=full_network,create=True)
+		id_vec = self.get_id_vector(snapshot_id=snapid)
+		nb_cols = nb_sim*len(id_vec)
+		if chunk_size is None:
+			block_size = nb_sim
+		else:
+			block_size = chunk_size
+
+		self.check_nb_simulations(snapshot_id=snapid,nb_sim=nb_sim,nb_sources=len(id_vec),**sim_cfg)
+		sel_query,sel_params = self.selected_simulations(snapshot_id=snapid,nb_sim=nb_sim,**sim_cfg)
+
+		if self.db.db_type == 'postgres':
+			cursor = self.db.connection.cursor(name='iter_results_{}'.format(snapid))
+			cursor.itersize = fetch_size
+		else:
+			cursor = self.db.connection.cursor()
+
+		def make_block(block,rows_i,cols_j):
+			width = min(block_size,nb_cols-block*block_size)
+			rows_i = np.concatenate(rows_i) if rows_i else np.zeros(0,dtype=np.int64)
+			cols_j = np.concatenate(cols_j)-block*block_size if cols_j else np.zeros(0,dtype=np.int64)
+			results = scipy.sparse.coo_matrix((np.ones(len(rows_i),dtype=bool),(rows_i,cols_j)),shape=(len(id_vec),width),dtype=bool).tocsr()
+			if chunk_size is None:
+				return int(id_vec[block]),results
+			else:
+				return block*block_size,results
+
+		try:
+			cursor.execute('''
+				SELECT ss.failing_project,ss.sim_rank,sr.failing FROM {} ss
+					INNER JOIN simulation_results sr
+					ON sr.simulation_id=ss.id
+					ORDER BY ss.failing_project,ss.sim_rank
+				;'''.format(sel_query),sel_params)
+			current_block = 0
+			rows_i = []
+			cols_j = []
+			while True:
+				rows = cursor.fetchmany(fetch_size)
+				if not rows:
+					break
+				orig_fps,sim_ranks,fps = utils.rows_to_arrays(rows,3)
+				cols = nb_sim*utils.ids_to_indices(id_vec,orig_fps)+sim_ranks
+				fp_indices = utils.ids_to_indices(id_vec,fps)
+				# rows are ordered by column, so each block is a contiguous slice of the batch
+				bounds = np.searchsorted(cols,(current_block+1+np.arange(cols[-1]//block_size-current_block+1))*block_size)
+				start = 0
+				for end in bounds:
+					rows_i.append(fp_indices[start:end])
+					cols_j.append(cols[start:end])
+					start = end
+					if start < len(cols):
+						yield make_block(current_block,rows_i,cols_j)
+						current_block += 1
+						rows_i = []
+						cols_j = []
+			while current_block*block_size < nb_cols:
+				yield make_block(current_block,rows_i,cols_j)
+				current_block += 1
+				rows_i = []
+				cols_j = []
+		finally:
+			cursor.close()
+
+	def get_results_from_aggregates(self,snapshot_id,id_vec,nb_sim,result_type='counts',aggregated=False,**sim_cfg):
+		'''
+		Same output as get_results_full for counts and aggregated nb_failing, read from the aggregate tables sim_agg and sim_agg_failing.
+		Only valid when aggregates_available returns True.
+		'''
+		sim_cfg_id = self.db.get_cfg_id(Simulation.complete_sim_cfg(**sim_cfg),create=False)
+		if self.db.db_type == 'postgres':
+			placeholder = '%s'
+		else:
+			placeholder = '?'
+		if result_type == 'counts':
+			if aggregated:
+				self.db.cursor.execute('''SELECT failing,SUM(nb_failing) FROM sim_agg_failing
+						WHERE snapshot_id={ph} AND sim_cfg_id={ph}
+						GROUP BY failing
+					;'''.format(ph=placeholder),(snapshot_id,sim_cfg_id))
+				fps,vals = utils.rows_to_arrays(self.db.cursor.fetchall(),2)
+				results = np.zeros((len(id_vec),))
+				results[utils.ids_to_indices(id_vec,fps)] = vals
+				return results/nb_sim
+			else:
+				self.db.cursor.execute('''SELECT failing,failing_project,nb_failing FROM sim_agg_failing
+						WHERE snapshot_id={ph} AND sim_cfg_id={ph}
+					;'''.format(ph=placeholder),(snapshot_id,sim_cfg_id))
+				fps,orig_fps,vals = utils.rows_to_arrays(self.db.cursor.fetchall(),3)
+				results_ijv = (vals,(utils.ids_to_indices(id_vec,fps),utils.ids_to_indices(id_vec,orig_fps)))
+				return scipy.sparse.coo_matrix(results_ijv,shape=(len(id_vec),len(id_vec),),dtype=np.int64).tocsr()/nb_sim
+		elif result_type == 'nb_failing' and aggregated:
+			self.db.cursor.execute('''SELECT failing_project,sum_failing FROM sim_agg
+					WHERE snapshot_id={ph} AND sim_cfg_id={ph}
+				;'''.format(ph=placeholder),(snapshot_id,sim_cfg_id))
+			orig_fps,vals = utils.rows_to_arrays(self.db.cursor.fetchall(),2)
+			results = np.zeros((len(id_vec),))
+			results[utils.ids_to_indices(id_vec,orig_fps)] = vals
+			return results/nb_sim
+		else:
+			raise ValueError('Results not available from aggregates for result_type {} (aggregated={})'.format(result_type,aggregated))
+
+	def compute_measure(self,measure,snapshot_id=None,bootstrap_dict=None,workers=1,**measure_cfg):
 		'''
 		Computes measure for all projects, for a given snapshot or iterating through all snapshots
+
+		When iterating through snapshots, the ones already computed are skipped up front.
+		With workers>1, snapshots are computed in parallel by worker processes, each one with its own database connection;
+		values are sent back and written by the current process. Falls back to serial computation for in-memory SQLite databases.
+		Measures writing to the database themselves (computed_* ones computing exact probabilities) should have these computed beforehand in parallel mode.
 		'''
 		try:
 			measure_func = getattr(measures,measure)
@@ -481,8 +652,21 @@ class ExperimentManager(object):
 			logger.info('Computing measure {} for all snapshots'.format(measure))
 			self.db.cursor.execute('SELECT id FROM snapshots;')
 			snapshot_id_list = [ r[0] for r in self.db.cursor.fetchall()]
-			for snapid in snapshot_id_list:
-				self.compute_measure(measure=measure,snapshot_id=snapid,bootstrap_dict=bootstrap_dict,**measure_cfg)
+			full_measure_cfg = getattr(measures,'complete_cfg_{}'.format(measure))(**measure_cfg)
+			snapshot_id_list = [snapid for snapid in snapshot_id_list if not self.db.check_measure(measure=measure,snapshot_id=snapid,**full_measure_cfg)]
+			logger.info('{} snapshots to compute for measure {}'.format(len(snapshot_id_list),measure))
+			if workers > 1 and len(snapshot_id_list) > 1 and not self.db.can_reconnect():
+				logger.info('In-memory SQLite database, computing measure {} serially'.format(measure))
+				workers = 1
+			if workers > 1 and len(snapshot_id_list) > 1:
+				self.db.connection.commit() # workers need to see the current state of the database
+				tasks = [(self.db.connection_params,measure,snapid,full_measure_cfg) for snapid in snapshot_id_list]
+				with multiprocessing.Pool(processes=min(workers,len(snapshot_id_list))) as pool:
+					for snapid,value_vec,projid_vec in pool.imap_unordered(compute_measure_worker,tasks):
+						self.db.fill_measures(measure=measure,snapshot_id=snapid,value_vec=value_vec,projid_vec=projid_vec,**full_measure_cfg)
+			else:
+				for snapid in snapshot_id_list:
+					self.compute_measure(measure=measure,snapshot_id=snapid,bootstrap_dict=bootstrap_dict,**measure_cfg)
 		else:
 			measure_cfg = getattr(measures,'complete_cfg_{}'.format(measure))(**measure_cfg)
 			if not self.db.check_measure(measure=measure,snapshot_id=snapshot_id,**measure_cfg):
@@ -493,73 +677,179 @@ class ExperimentManager(object):
 				logger.info('Measure {} for snapshot {} already computed'.format(measure,snapshot_id))
 
 
-	def plot_measure(self,measure,project_name=None,project_id=None,show=True,**measure_cfg):
+	def compute_measures(self,measure_list,snapshot_id=None,bootstrap_dict=None,**measure_cfg):
 		'''
-		Plots measure across time for a given project
+		Computes several measures in one pass per snapshot, for a given snapshot or iterating through all snapshots.
+		Elements of measure_list are measure names, using measure_cfg, or (measure,cfg) tuples.
+
+		Measures are ordered by the data they rely on (see measures.REQUIREMENTS), and share the network and results loaded for a snapshot through bootstrap_dict.
+		All values of a snapshot are written in a single transaction.
 		'''
-		if project_name is None and project_id is None:
-			raise ValueError('Provide project_name or project_id')
-		elif project_name is None:
-			project_name = self.db.get_project_name(project_id=project_id)
+		measure_tasks = []
+		for m in measure_list:
+			if isinstance(m,str):
+				measure,cfg = m,measure_cfg
+			else:
+				measure,cfg = m
+			if not hasattr(measures,measure):
+				raise ValueError('Unknown measure {}'.format(measure))
+			measure_tasks.append((measure,getattr(measures,'complete_cfg_{}'.format(measure))(**cfg)))
+		measure_tasks.sort(key=lambda t:measures.REQUIREMENTS_ORDER.index(measures.REQUIREMENTS.get(t[0],'exact')))
+
+		if snapshot_id is None:
+			logger.info('Computing measures {} for all snapshots'.format([m for m,_ in measure_tasks]))
+			self.db.cursor.execute('SELECT id FROM snapshots;')
+			snapshot_id_list = [ r[0] for r in self.db.cursor.fetchall()]
+			for snapid in snapshot_id_list:
+				self.compute_measures(measure_list=measure_tasks,snapshot_id=snapid,bootstrap_dict=bootstrap_dict)
 		else:
-			project_id = self.db.get_project_id(project_name=project_name)
+			if bootstrap_dict is None:
+				bootstrap_dict = {}
+			computed = []
+			for measure,cfg in measure_tasks:
+				if self.db.check_measure(measure=measure,snapshot_id=snapshot_id,**cfg):
+					logger.info('Measure {} for snapshot {} already computed'.format(measure,snapshot_id))
+				else:
+					logger.info('Computing measure {} for snapshot {}'.format(measure,snapshot_id))
+					value_vec,projid_vec = getattr(measures,measure)(snapshot_id=snapshot_id,xp_man=self,bootstrap_dict=bootstrap_dict,**cfg)
+					computed.append((measure,cfg,value_vec,projid_vec))
+			for measure,cfg,value_vec,projid_vec in computed:
+				self.db.fill_measures(measure=measure,snapshot_id=snapshot_id,value_vec=value_vec,projid_vec=projid_vec,commit=False,**cfg)
+			self.db.connection.commit()
+
+	def get_measure_matrix(self,measure,project_ids=None,project_names=None,**measure_cfg):
+		'''
+		Returns values of a measure as a matrix [project,snapshot] (NaN where not available), along with the vector of project ids and the list of snapshot times.
+		Snapshots are the ones for which the measure has been computed, ordered by time. Projects are all the ones having values, or only project_ids/project_names if provided (in that order).
 
-		try:
-			measure_func = getattr(measures,measure)
-		except:
-			raise ValueError('Unknown measure {}'.format(measure))
+		Values of all projects are loaded in a single query and kept in cache, reloaded only when the measure is computed for new snapshots.
+		'''
 		measure_cfg = getattr(measures,'complete_cfg_{}'.format(measure))(**measure_cfg)
+		measure_id = self.db.get_measure_id(measure,create=False,**measure_cfg)
+		if measure_id is None:
+			raise ValueError('Measure {} with configuration {} has not been computed'.format(measure,measure_cfg))
 
 		if self.db.db_type == 'postgres':
-			self.db.cursor.execute('''
-				SELECT m.value,s.snapshot_time FROM measures m
-					INNER JOIN measure_types mt
-						ON mt.name=%s
-						AND mt.cfg=%s
-						AND mt.id=m.measure_id
-						AND m.project_id=%s
+			self.db.cursor.execute('''SELECT s.id,s.snapshot_time FROM computed_measures cm
 					INNER JOIN snapshots s
-						ON m.snapshot_id=s.id
-					ORDER BY s.snapshot_time
-				;''',(measure,json.dumps(measure_cfg, indent=None, sort_keys=True),project_id))
+					ON cm.measure_id=%s AND s.id=cm.snapshot_id
+					ORDER BY s.snapshot_time,s.id
+				;''',(measure_id,))
 		else:
-			self.db.cursor.execute('''
-				SELECT m.value,s.snapshot_time FROM measures m
-					INNER JOIN measure_types mt
-						ON mt.name=?
-						AND mt.cfg=?
-						AND mt.id=m.measure_id
-						AND m.project_id=?
+			self.db.cursor.execute('''SELECT s.id,s.snapshot_time FROM computed_measures cm
 					INNER JOIN snapshots s
-						ON m.snapshot_id=s.id
-					ORDER BY s.snapshot_time
-				;''',(measure,json.dumps(measure_cfg, indent=None, sort_keys=True),project_id))
-		values = []
-		dates = []
-		for v,d in self.db.cursor.fetchall():
-			values.append(v)
-			dates.append(d)
-
-
-		plt.plot(dates,values,label=project_name)
-		plt.gcf().autofmt_xdate()
-		# ax.fmt_xdata = mdates.DateFormatter('%Y-%m-%d')
-		plt.title(measure)
+					ON cm.measure_id=? AND s.id=cm.snapshot_id
+					ORDER BY s.snapshot_time,s.id
+				;''',(measure_id,))
+		snapshots = self.db.cursor.fetchall()
+		snapshot_ids = np.asarray([snapid for snapid,_ in snapshots],dtype=np.int64)
+
+		cached = self.measure_matrix_cache.get(measure_id)
+		if cached is None or not np.array_equal(cached[2],snapshot_ids):
+			logger.info('Loading values of measure {} for {} snapshots'.format(measure,len(snapshot_ids)))
+			if self.db.db_type == 'postgres':
+				self.db.cursor.execute('SELECT project_id,snapshot_id,value FROM measures WHERE measure_id=%s;',(measure_id,))
+			else:
+				self.db.cursor.execute('SELECT project_id,snapshot_id,value FROM measures WHERE measure_id=?;',(measure_id,))
+			proj_col,snap_col,value_col = utils.rows_to_arrays(self.db.cursor.fetchall(),3,dtype=np.float64)
+			proj_col = proj_col.astype(np.int64)
+			all_project_ids = np.unique(proj_col)
+			snap_order = np.argsort(snapshot_ids)
+			matrix = np.full((len(all_project_ids),len(snapshot_ids)),np.nan)
+			matrix[utils.ids_to_indices(all_project_ids,proj_col),snap_order[utils.ids_to_indices(snapshot_ids[snap_order],snap_col.astype(np.int64))]] = value_col
+			cached = (matrix,all_project_ids,snapshot_ids)
+			self.measure_matrix_cache[measure_id] = cached
+		matrix,all_project_ids,_ = cached
+
+		if project_names is not None:
+			project_ids = self.get_project_ids(project_names)
+		snapshot_times = [utils.clean_timestamp(t) for _,t in snapshots]
+		if project_ids is None:
+			return matrix.copy(),all_project_ids.copy(),snapshot_times
+		else:
+			project_ids = np.asarray(project_ids,dtype=np.int64)
+			values = np.full((len(project_ids),len(snapshot_ids)),np.nan)
+			if len(all_project_ids):
+				indices = np.minimum(np.searchsorted(all_project_ids,project_ids),len(all_project_ids)-1)
+				found = all_project_ids[indices] == project_ids
+				values[found] = matrix[indices[found]]
+			return values,project_ids,snapshot_times
+
+	def get_project_ids(self,project_names):
+		'''
+		Resolves a list of project names to their ids in a single query. Raises an error for unknown names.
+		'''
+		project_names = list(project_names)
+		if self.db.db_type == 'postgres':
+			self.db.cursor.execute('SELECT name,id FROM projects WHERE name IN %s;',(tuple(project_names),))
+		else:
+			self.db.cursor.execute('SELECT name,id FROM projects WHERE name IN ({});'.format(','.join(['?' for _ in project_names])),project_names)
+		ids = dict(self.db.cursor.fetchall())
+		missing = [n for n in project_names if n not in ids]
+		if missing:
+			raise ValueError('Unknown project names: {}'.format(missing))
+		return [ids[n] for n in project_names]
+
+	def plot_measure(self,measure,project_name=None,project_id=None,show=True,project_names=None,project_ids=None,filename=None,**measure_cfg):
+		'''
+		Plots measure across time for a given project, or for several ones with project_names or project_ids (one series each).
+		Values are taken from get_measure_matrix.
+
+		If filename is provided, the plot is drawn on a standalone figure (no interactive backend needed), saved to filename and returned.
+		Otherwise it is drawn with pyplot, on the current figure.
+		'''
+		if project_names is None and project_ids is None:
+			if project_name is None and project_id is None:
+				raise ValueError('Provide project_name or project_id')
+			elif project_name is None:
+				project_name = self.db.get_project_name(project_id=project_id)
+			else:
+				project_id = self.db.get_project_id(project_name=project_name)
+			project_ids = [project_id]
+			project_names = [project_name]
+		elif project_names is not None:
+			project_ids = self.get_project_ids(project_names)
+		else:
+			project_names = [self.db.get_project_name(project_id=p_id) for p_id in project_ids]
 
-		if show:
+		if not hasattr(measures,measure):
+			raise ValueError('Unknown measure {}'.format(measure))
+		values,project_ids,dates = self.get_measure_matrix(measure=measure,project_ids=project_ids,**measure_cfg)
+
+		if filename is not None:
+			fig = matplotlib.figure.Figure()
+			FigureCanvasAgg(fig)
+			ax = fig.add_subplot(1,1,1)
+		else:
+			fig = plt.gcf()
+			ax = plt.gca()
+		for name,series in zip(project_names,values):
+			available = ~np.isnan(series)
+			ax.plot([d for d,a in zip(dates,available) if a],series[available],label=name)
+		fig.autofmt_xdate()
+		# ax.fmt_xdata = mdates.DateFormatter('%Y-%m-%d')
+		ax.set_title(measure)
+		if len(project_names) > 1:
+			ax.legend()
+
+		if filename is not None:
+			fig.savefig(filename)
+			return fig
+		elif show:
 			plt.show()
 
 
-	def compute_exact_proba(self,snapshot_id=None,bootstrap_dict=None,proba_implementation='network',**sim_cfg):
+	def compute_exact_proba(self,snapshot_id=None,bootstrap_dict=None,proba_implementation='network',batch_size=1000,**sim_cfg):
 		'''
 		Computes proba distributions for all projects, for a given snapshot or iterating through all snapshots and source failing_project
+		Values are written batch_size sources at a time.
 		'''
 		if snapshot_id is None:
 			logger.info('Computing proba_distrib for all snapshots')
 			self.db.cursor.execute('SELECT id FROM snapshots;')
 			snapshot_id_list = [ r[0] for r in self.db.cursor.fetchall()]
 			for snapid in snapshot_id_list:
-				self.compute_exact_proba(snapshot_id=snapid,bootstrap_dict=bootstrap_dict,proba_implementation=proba_implementation,**sim_cfg)
+				self.compute_exact_proba(snapshot_id=snapid,bootstrap_dict=bootstrap_dict,proba_implementation=proba_implementation,batch_size=batch_size,**sim_cfg)
 		else:
 			logger.info('Computing proba_distrib for snapshot {}'.format(snapshot_id))
 			sim_cfg = Simulation.complete_sim_cfg(**sim_cfg)
@@ -567,10 +857,28 @@ class ExperimentManager(object):
 				network = self.db.get_network(snapshot_id=snapshot_id)
 				sim = Simulation(failing_project=None,snapshot_id=snapshot_id,network=network,**sim_cfg)
 				projid_vec = self.get_id_vector(snapshot_id=snapshot_id)
-				for p_id in projid_vec:
-					logger.info('Computing proba distrib for snapshot {} with source failing project {}'.format(snapshot_id,p_id))
-					sim.failing_project = p_id
-					value_vec = sim.compute_exact(implementation=proba_implementation)
-					self.db.fill_exact_comp(snapshot_id=snapshot_id,source_id=p_id,value_vec=value_vec,projid_vec=projid_vec,commit=False,proba_implementation=proba_implementation,**sim_cfg)
+				for batch_start in range(0,len(projid_vec),batch_size):
+					source_ids = projid_vec[batch_start:batch_start+batch_size]
+					value_mat = []
+					for p_id in source_ids:
+						logger.info('Computing proba distrib for snapshot {} with source failing project {}'.format(snapshot_id,p_id))
+						sim.failing_project = p_id
+						value_mat.append(sim.compute_exact(implementation=proba_implementation))
+					self.db.fill_exact_comp_bulk(snapshot_id=snapshot_id,source_ids=source_ids,value_mat=np.asarray(value_mat),projid_vec=projid_vec,commit=False,proba_implementation=proba_implementation,**sim_cfg)
+				self.db.connection.commit()
 			else:
 				logger.info('Proba distrib for snapshot {} already computed'.format(snapshot_id))
+
+
+def compute_measure_worker(task):
+	'''
+	Computes a measure for one snapshot in a worker process, with its own database connection.
+	Returns the values instead of writing them, the calling process being the only writer.
+	task is a tuple (connection_params,measure,snapshot_id,measure_cfg), measure_cfg being already completed.
+	'''
+	connection_params,measure,snapshot_id,measure_cfg = task
+	xp_man = ExperimentManager(init_tables=False,**connection_params)
+	logger.info('Computing measure {} for snapshot {} in worker {}'.format(measure,snapshot_id,os.getpid()))
+	value_vec,projid_vec = getattr(measures,measure)(snapshot_id=snapshot_id,xp_man=xp_man,**measure_cfg)
+	xp_man.db.connection.close()
+	return snapshot_id,np.asarray(value_vec),np.asarray(projid_vec)
@@ -1,35 +1,154 @@
 import numpy as np
+import copy
+import json
+import scipy.sparse
 from . import simulations
+from . import utils
+
+###################
+# SHARED DATA
+###################
+# Data each measure relies on, used by ExperimentManager.compute_measures to order computations.
+# counts comes before nb_failing, the aggregated cascade lengths being derived from the counts matrix when it is already loaded.
+REQUIREMENTS = {
+	'in_degree':'network',
+	'out_degree':'network',
+	'failure_proba':'counts',
+	'causing_failure_proba':'counts',
+	'mean_cascade_length':'nb_failing',
+	'computed_failure_proba':'exact',
+	'computed_causing_failure_proba':'exact',
+	}
+REQUIREMENTS_ORDER = ['network','counts','nb_failing','exact']
+
+def shared_results(snapshot_id,xp_man,nb_sim,result_type,aggregated=False,bootstrap_dict=None,**sim_cfg):
+	'''
+	Wrapper around get_results_full, storing results in bootstrap_dict if provided, so that measures on the same snapshot share a single results query.
+	Aggregated nb_failing results are derived from the counts matrix if it is already available.
+	'''
+	cfg_str = json.dumps(simulations.Simulation.complete_sim_cfg(in_place=False,**sim_cfg),sort_keys=True)
+	key = ('results',snapshot_id,nb_sim,result_type,aggregated,cfg_str)
+	if bootstrap_dict is not None and key in bootstrap_dict:
+		return bootstrap_dict[key]
+	counts_key = ('results',snapshot_id,nb_sim,'counts',False,cfg_str)
+	if result_type == 'nb_failing' and aggregated and bootstrap_dict is not None and counts_key in bootstrap_dict:
+		results = np.asarray(bootstrap_dict[counts_key].sum(axis=0)).ravel()
+	else:
+		results = xp_man.get_results_full(result_type=result_type,aggregated=aggregated,snapshot_id=snapshot_id,nb_sim=nb_sim,**sim_cfg)
+	if bootstrap_dict is not None:
+		bootstrap_dict[key] = results
+	return results
+
+###################
+# NETWORK HELPERS
+###################
+def adjacency_matrix(snapshot_id,xp_man,bootstrap_dict=None):
+	'''
+	Sparse boolean adjacency matrix of the snapshot (CSR, [project_using,project_used]) and the sorted vector of project ids indexing it.
+	Stored in bootstrap_dict if provided, to be shared between measures computed on the same snapshot.
+	'''
+	if bootstrap_dict is not None and ('adjacency',snapshot_id) in bootstrap_dict:
+		return bootstrap_dict[('adjacency',snapshot_id)]
+	edges,nodes = xp_man.db.get_network_arrays(snapshot_id=snapshot_id)
+	rows = utils.ids_to_indices(nodes,edges[:,0])
+	cols = utils.ids_to_indices(nodes,edges[:,1])
+	adj = scipy.sparse.coo_matrix((np.ones(len(rows),dtype=bool),(rows,cols)),shape=(len(nodes),len(nodes)),dtype=bool).tocsr()
+	if bootstrap_dict is not None:
+		bootstrap_dict[('adjacency',snapshot_id)] = (adj,nodes)
+	return adj,nodes
+
+def nth_order_counts(adj,order):
+	'''
+	For each node (column of adj), number of other nodes reaching it in at most order steps.
+	Iterated sparse products restricted to the frontier: at step k only the pairs at distance exactly k-1 are extended.
+	'''
+	reached = adj.astype(np.int32)
+	frontier = reached
+	for _ in range(order-1):
+		step = frontier.dot(adj.astype(np.int32))
+		step.data[:] = 1
+		frontier = step - step.multiply(reached)
+		frontier.eliminate_zeros()
+		if frontier.nnz == 0:
+			break
+		reached = reached + frontier
+	return reached.getnnz(axis=0) - (reached.diagonal() != 0)
+
+POPCOUNT_TABLE = np.asarray([bin(k).count('1') for k in range(256)],dtype=np.uint8)
+
+def transitive_counts(adj,max_block_bytes=2**28):
+	'''
+	For each node (column of adj), number of nodes having a path towards it (infinite order).
+	Bitset closure along topological levels: for a block of up to 64*nb_words nodes, each node carries nb_words uint64 words
+	flagging which nodes of the block reach it, OR-ed level by level over incoming edges.
+	Memory is bounded by max_block_bytes, the number of blocks growing accordingly.
+	Raises a ValueError if the network has cycles.
+	'''
+	nb_nodes = adj.shape[0]
+	adj = adj.tocsr()
+	# topological levels (Kahn's algorithm, one level at a time)
+	remaining = adj.getnnz(axis=0)
+	level = np.full(nb_nodes,-1,dtype=np.int64)
+	frontier = np.flatnonzero(remaining == 0)
+	current_level = 0
+	while len(frontier):
+		level[frontier] = current_level
+		touched = np.bincount(adj[frontier].indices,minlength=nb_nodes)
+		remaining = remaining - touched
+		frontier = np.flatnonzero((touched > 0) & (remaining == 0))
+		current_level += 1
+	if (level < 0).any():
+		raise ValueError('Network has cycles, transitive counts need a DAG (see Database.detect_cycles)')
+
+	# edges sorted by level of target, then target: incoming edges of a level form one slice, grouped by target
+	coo = adj.tocoo()
+	order = np.lexsort((coo.col,level[coo.col]))
+	src = coo.row[order]
+	tgt = coo.col[order]
+	level_bounds = np.searchsorted(level[tgt],np.arange(1,current_level+1))
+
+	counts = np.zeros(nb_nodes,dtype=np.int64)
+	seeds = np.flatnonzero(adj.getnnz(axis=1) > 0) # nodes without outgoing edges reach no one
+	nb_words = int(max(1,min(-(-len(seeds)//64),max_block_bytes//(8*max(nb_nodes,1)))))
+	block_size = 64*nb_words
+	for block_start in range(0,len(seeds),block_size):
+		block = seeds[block_start:block_start+block_size]
+		bits = np.zeros((nb_nodes,nb_words),dtype=np.uint64)
+		positions = np.arange(len(block))
+		bits[block,positions//64] = np.left_shift(np.uint64(1),(positions % 64).astype(np.uint64))
+		for l in range(1,current_level):
+			start,end = level_bounds[l-1],level_bounds[l]
+			if start == end:
+				continue
+			targets = tgt[start:end]
+			group_starts = np.flatnonzero(np.r_[True,targets[1:] != targets[:-1]])
+			reduced = np.bitwise_or.reduceat(bits[src[start:end]],group_starts,axis=0)
+			bits[targets[group_starts]] |= reduced
+		counts += POPCOUNT_TABLE[bits.view(np.uint8)].reshape((nb_nodes,-1)).sum(axis=1,dtype=np.int64)
+		counts[block] -= 1
+	return counts
 
 ###################
 # IN DEGREE
 ###################
 def in_degree(snapshot_id,xp_man,bootstrap_dict=None,order=1):
 	'''
-	in degree of each project, to nth order (default one)
+	in degree of each project, to nth order (default one): number of projects depending on it through at most order links.
+	order<1 stands for infinite order, i.e. all direct and indirect dependents.
 	'''
-
-	net = xp_man.db.get_network(snapshot_id=snapshot_id)
-	value_vec = []
-	projid_vec = []
+	adj,nodes = adjacency_matrix(snapshot_id=snapshot_id,xp_man=xp_man,bootstrap_dict=bootstrap_dict)
 
 	if order == 1:
 		#classic case
-		for k,v in dict(net.in_degree()).items():
-			value_vec.append(v)
-			projid_vec.append(k)
+		value_vec = adj.getnnz(axis=0)
 	elif order>1:
 		# order is integer
-		raise NotImplementedError
-		for o in order:
-			for k,v in dict(net.in_degree()).items():
-				value_vec.append(v)
-				projid_vec.append(k)
+		value_vec = nth_order_counts(adj,order=int(order))
 	else:
 		#'infinite order'
-		raise NotImplementedError
+		value_vec = transitive_counts(adj)
 
-	return np.asarray(value_vec),np.asarray(projid_vec)
+	return np.asarray(value_vec,dtype=np.int64),np.asarray(nodes)
 
 ###################
 def complete_cfg_in_degree(order=1,**measure_cfg):
@@ -43,20 +162,19 @@ def complete_cfg_in_degree(order=1,**measure_cfg):
 ###################
 def out_degree(snapshot_id,xp_man,bootstrap_dict=None,order=1):
 	'''
-	out degree of each project
+	out degree of each project, to nth order (default one): number of projects it depends on through at most order links.
+	order<1 stands for infinite order, i.e. all direct and indirect dependencies.
 	'''
-	net = xp_man.db.get_network(snapshot_id=snapshot_id)
+	adj,nodes = adjacency_matrix(snapshot_id=snapshot_id,xp_man=xp_man,bootstrap_dict=bootstrap_dict)
 
 	if order == 1:
-		value_vec = []
-		projid_vec = []
-		for k,v in dict(net.out_degree()).items():
-			value_vec.append(v)
-			projid_vec.append(k)
+		value_vec = adj.getnnz(axis=1)
+	elif order>1:
+		value_vec = nth_order_counts(adj.T.tocsr(),order=int(order))
 	else:
-		raise NotImplementedError
+		value_vec = transitive_counts(adj.T.tocsr())
 
-	return np.asarray(value_vec),np.asarray(projid_vec)
+	return np.asarray(value_vec,dtype=np.int64),np.asarray(nodes)
 
 ###################
 def complete_cfg_out_degree(order=1,**measure_cfg):
@@ -72,7 +190,7 @@ def mean_cascade_length(snapshot_id,xp_man,nb_sim,bootstrap_dict=None,**sim_cfg)
 	'''
 	mean_cascade_length for each project as in number of affected projects when used as a source of failure, average over number of available simulations
 	'''
-	results = xp_man.get_results(result_type='nb_failing',aggregated=True,snapshot_id=snapshot_id,nb_sim=nb_sim,**sim_cfg)
+	results = shared_results(result_type='nb_failing',aggregated=True,snapshot_id=snapshot_id,xp_man=xp_man,nb_sim=nb_sim,bootstrap_dict=bootstrap_dict,**sim_cfg)
 	# if xp_man.db.db_type == 'postgres':
 	# 	xp_man.db.cursor.execute('SELECT COUNT(*) FROM simulations WHERE snapshot_id=%s GROUP BY failing_project LIMIT 1;',(snapshot_id,))
 	# else:
@@ -94,12 +212,105 @@ def complete_cfg_mean_cascade_length(nb_sim,**measure_cfg):
 ###################
 #FAILURE_PROBA function of source_id
 ###################
+def failure_proba(snapshot_id,xp_man,nb_sim,bootstrap_dict=None,**sim_cfg):
+	'''
+	For each project used as a source of failure, average probability of failure of the other projects, estimated over nb_sim simulations per source
+	'''
+	results = shared_results(result_type='counts',snapshot_id=snapshot_id,xp_man=xp_man,nb_sim=nb_sim,bootstrap_dict=bootstrap_dict,**sim_cfg) # sparse_mat[project,orig_failing_project]
+	id_vec = xp_man.get_id_vector(snapshot_id=snapshot_id)
+	value_vec = (np.asarray(results.sum(axis=0)).ravel()-results.diagonal())/max(len(id_vec)-1,1)
+	return value_vec,id_vec
+
+###################
+def complete_cfg_failure_proba(nb_sim,**measure_cfg):
+	cfg = simulations.Simulation.complete_sim_cfg(in_place=False,**measure_cfg)
+	cfg['nb_sim'] = nb_sim
+	return cfg
+###################
+###################
+
 ###################
 #CAUSING_FAILURE_PROBA function of target_id
 ###################
+def causing_failure_proba(snapshot_id,xp_man,nb_sim,bootstrap_dict=None,**sim_cfg):
+	'''
+	For each project, average probability of being affected by the failure of another project, estimated over nb_sim simulations per source
+	'''
+	results = shared_results(result_type='counts',snapshot_id=snapshot_id,xp_man=xp_man,nb_sim=nb_sim,bootstrap_dict=bootstrap_dict,**sim_cfg) # sparse_mat[project,orig_failing_project]
+	id_vec = xp_man.get_id_vector(snapshot_id=snapshot_id)
+	value_vec = (np.asarray(results.sum(axis=1)).ravel()-results.diagonal())/max(len(id_vec)-1,1)
+	return value_vec,id_vec
+
+###################
+def complete_cfg_causing_failure_proba(nb_sim,**measure_cfg):
+	cfg = simulations.Simulation.complete_sim_cfg(in_place=False,**measure_cfg)
+	cfg['nb_sim'] = nb_sim
+	return cfg
+###################
+###################
+
 ###################
 #COMPUTED_CAUSING_FAILURE_PROBA function of target_id
 ###################
+def computed_causing_failure_proba(snapshot_id,xp_man,bootstrap_dict=None,proba_implementation='network',**sim_cfg):
+	'''
+	Same as causing_failure_proba, from the exact probabilities of failure (computed if not available yet)
+	'''
+	return exact_proba_sums(snapshot_id=snapshot_id,xp_man=xp_man,group_by='target_id',bootstrap_dict=bootstrap_dict,proba_implementation=proba_implementation,**sim_cfg)
+
+###################
+def complete_cfg_computed_causing_failure_proba(proba_implementation='network',**measure_cfg):
+	cfg = simulations.Simulation.complete_sim_cfg(in_place=False,**measure_cfg)
+	cfg['proba_implementation'] = proba_implementation
+	return cfg
+###################
+###################
+
 ###################
 #COMPUTED_FAILURE_PROBA function of source_id
 ###################
+def computed_failure_proba(snapshot_id,xp_man,bootstrap_dict=None,proba_implementation='network',**sim_cfg):
+	'''
+	Same as failure_proba, from the exact probabilities of failure (computed if not available yet)
+	'''
+	return exact_proba_sums(snapshot_id=snapshot_id,xp_man=xp_man,group_by='source_id',bootstrap_dict=bootstrap_dict,proba_implementation=proba_implementation,**sim_cfg)
+
+###################
+def complete_cfg_computed_failure_proba(proba_implementation='network',**measure_cfg):
+	cfg = simulations.Simulation.complete_sim_cfg(in_place=False,**measure_cfg)
+	cfg['proba_implementation'] = proba_implementation
+	return cfg
+###################
+###################
+
+def exact_proba_sums(snapshot_id,xp_man,group_by,bootstrap_dict=None,proba_implementation='network',**sim_cfg):
+	'''
+	Sums of exact probabilities of failure over targets (group_by='source_id') or over sources (group_by='target_id'), excluding source=target,
+	normalized by the number of other projects. Aggregation is done in the database.
+	'''
+	if group_by not in ('source_id','target_id'):
+		raise ValueError('group_by should be source_id or target_id, not {}'.format(group_by))
+	sim_cfg = simulations.Simulation.complete_sim_cfg(in_place=False,**sim_cfg)
+	xp_man.compute_exact_proba(snapshot_id=snapshot_id,bootstrap_dict=bootstrap_dict,proba_implementation=proba_implementation,**sim_cfg)
+	excomp_cfg = copy.deepcopy(sim_cfg)
+	excomp_cfg['proba_implementation'] = proba_implementation
+	cfg_id = xp_man.db.get_cfg_id(excomp_cfg,create=False)
+	if xp_man.db.db_type == 'postgres':
+		xp_man.db.cursor.execute('''SELECT ecv.{group_by},SUM(ecv.proba_value) FROM exact_computation ec
+					INNER JOIN exact_computation_values ecv
+					ON ecv.exact_comp_id=ec.id AND ec.snapshot_id=%s AND ec.cfg_id=%s
+					AND ecv.source_id<>ecv.target_id
+					GROUP BY ecv.{group_by}
+				;'''.format(group_by=group_by),(snapshot_id,cfg_id))
+	else:
+		xp_man.db.cursor.execute('''SELECT ecv.{group_by},SUM(ecv.proba_value) FROM exact_computation ec
+					INNER JOIN exact_computation_values ecv
+					ON ecv.exact_comp_id=ec.id AND ec.snapshot_id=? AND ec.cfg_id=?
+					AND ecv.source_id<>ecv.target_id
+					GROUP BY ecv.{group_by}
+				;'''.format(group_by=group_by),(snapshot_id,cfg_id))
+	ids,sums = utils.rows_to_arrays(xp_man.db.cursor.fetchall(),2,dtype=np.float64)
+	id_vec = xp_man.get_id_vector(snapshot_id=snapshot_id)
+	value_vec = np.zeros((len(id_vec),))
+	value_vec[utils.ids_to_indices(id_vec,ids.astype(np.int64))] = sums
+	return value_vec/max(len(id_vec)-1,1),id_vec
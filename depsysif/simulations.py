@@ -18,9 +18,67 @@ logger.addHandler(ch)
 logger.setLevel(logging.INFO)
 
 
+def splitmix64(x):
+	'''
+	SplitMix64 mixing function, applied elementwise on a uint64 array (wrapping arithmetic)
+	'''
+	with np.errstate(over='ignore'):
+		x = x + np.uint64(0x9E3779B97F4A7C15)
+		x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+		x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+		return x ^ (x >> np.uint64(31))
+
+def edge_uniforms(random_seed,source,using,used):
+	'''
+	Uniform draws in [0,1) for the edges (using[k],used[k]) (project ids), as a hash of (random_seed,source,using,used).
+	The draw of an edge does not depend on the rest of the network: the same edge gets the same draw in all snapshots (common random numbers).
+	'''
+	key = splitmix64(splitmix64(np.asarray([random_seed],dtype=np.uint64)) ^ np.asarray([source],dtype=np.uint64))
+	h = splitmix64(key ^ np.asarray(using,dtype=np.uint64))
+	h = splitmix64(h ^ np.asarray(used,dtype=np.uint64))
+	return (h >> np.uint64(11)).astype(np.float64) * 2.**-53
+
+def invalidated_sources(prev_edges,prev_nodes,edges,nodes,norm_exponent=0.):
+	'''
+	Sources of failure whose crn cascades may differ between two versions of a network, given as edge arrays (columns project_using,project_used) and node arrays.
+	A cascade is unchanged if it cannot reach a project whose users (or their propagation probabilities) changed; other sources are returned as a sorted array of project ids, together with the new projects.
+	'''
+	prev_codes = prev_edges[:,0].astype(np.int64)*2**32 + prev_edges[:,1]
+	codes = edges[:,0].astype(np.int64)*2**32 + edges[:,1]
+	diff = np.setxor1d(prev_codes,codes)
+	changed = [diff % 2**32,np.setdiff1d(nodes,prev_nodes)]
+	if norm_exponent != 0:
+		prev_users,prev_outdeg = np.unique(prev_edges[:,0],return_counts=True)
+		users,outdeg = np.unique(edges[:,0],return_counts=True)
+		deg_diff = np.setxor1d(prev_users*2**32+prev_outdeg,users*2**32+outdeg)
+		changed.append(prev_edges[np.isin(prev_edges[:,0],deg_diff // 2**32),1])
+	changed = np.unique(np.concatenate(changed))
+
+	# cascades reaching a changed project start from the projects it depends on, directly or indirectly
+	changed_prev = changed[np.isin(changed,prev_nodes)]
+	if len(prev_nodes) and len(changed_prev):
+		index = {n:i for i,n in enumerate(prev_nodes.tolist())}
+		used_mat = scipy.sparse.csr_matrix((np.ones(len(prev_edges),dtype=bool),([index[n] for n in prev_edges[:,0].tolist()],[index[n] for n in prev_edges[:,1].tolist()])),shape=(len(prev_nodes),len(prev_nodes)))
+		reached = np.zeros((len(prev_nodes),),dtype=bool)
+		frontier = np.asarray([index[n] for n in changed_prev.tolist()])
+		reached[frontier] = True
+		while len(frontier):
+			new_nodes = used_mat[frontier].indices
+			frontier = np.unique(new_nodes[~reached[new_nodes]])
+			reached[frontier] = True
+		changed = np.union1d(changed,prev_nodes[reached])
+	return changed
+
+
 class Simulation(object):
 	'''
 	Simulation objects simulate cascades of failures in projects through the dependency hierarchy
+
+	Implementations:
+	classic: propagation node by node, using the random generator seeded with random_seed
+	matrix: propagation by sparse matrix products, using the random generator seeded with random_seed
+	crn: each edge fires with a fixed draw given by edge_uniforms (common random numbers), so that a run with a given random_seed
+		is identical across snapshots for the parts of the network that did not change
 	'''
 	default_propag_proba = 0.9
 	default_norm_exponent=0.
@@ -87,6 +145,9 @@ class Simulation(object):
 			self.index_reverse = bootstrap_sim.index_reverse
 			self.propag_mat = bootstrap_sim.propag_mat
 			self.network_diameter = bootstrap_sim.network_diameter
+			self.users_mat = bootstrap_sim.users_mat
+			self.out_degree_norm = bootstrap_sim.out_degree_norm
+			self.edge_propag_proba = bootstrap_sim.edge_propag_proba
 
 		elif network is not None:
 			self.network = network
@@ -99,6 +160,16 @@ class Simulation(object):
 					norm_propag = 1./np.power(self.sparse_mat.sum(axis=0),self.norm_exponent)
 			# self.propag_mat = nx.to_scipy_sparse_matrix(network).multiply(self.propag_proba/norm_propag).tocsr()
 				self.propag_mat = self.sparse_mat.multiply(self.propag_proba/norm_propag).tocsr()
+				# for crn: row n lists the projects using n, and each user has its propagation probability
+				self.users_mat = self.sparse_mat.transpose().tocsr()
+				out_degree = np.asarray(self.sparse_mat.sum(axis=1)).ravel()
+				self.out_degree_norm = np.power(out_degree.astype(np.float64),self.norm_exponent)
+				with np.errstate(divide='ignore'):
+					self.edge_propag_proba = self.propag_proba/self.out_degree_norm
+			else:
+				self.users_mat = None
+				self.out_degree_norm = None
+				self.edge_propag_proba = None
 			# self.propag_mat = nx.to_scipy_sparse_matrix(network).transpose().multiply(self.propag_proba/norm_propag).tocsr()
 			# self.propag_mat = nx.to_scipy_sparse_matrix(network).multiply(self.propag_proba/norm_propag).tocsr() # CHECK MULTIPLICATIONS ARE ALONG RIGHT DIMENSIONS
 			# self.network_diameter = nx.diameter(self.network.to_undirected())
@@ -221,15 +292,98 @@ class Simulation(object):
 						logger.info('Iteration {}, new failing {}, total failing {}, total nodes {}'.format(iteration,new_failed.sum(),failed_nodes.sum(),total_nodes))
 
 
+			elif self.implementation == 'crn':
+				total_nodes = len(self.network.nodes())
+				project_nb = self.index_reverse[project_id]
+				failed_nodes = self.crn_cascade(project_nb=project_nb)
+
 			else:
-				raise ValueError('Unknown implementation: {}'.format(implementation))
+				raise ValueError('Unknown implementation: {}'.format(self.implementation))
 
 
-			if full_results:
-				# self.results = {'raw':failed_nodes,'ids':[int(self.index_nodes[p_nb]) for p_nb in np.where(failed_nodes)[0]],'failing_project':project_id}
-				self.results = {'raw':failed_nodes,'ids':self.index_nodes[np.where(failed_nodes)[0]],'failing_project':project_id}
-			else:
-				self.results = {'raw':failed_nodes}
+			self.set_results(failed_nodes=failed_nodes,project_id=project_id,full_results=full_results)
+
+	def set_results(self,failed_nodes,project_id,full_results=True):
+		'''
+		Sets the results attribute from the boolean vector of failed nodes
+		'''
+		if full_results:
+			# self.results = {'raw':failed_nodes,'ids':[int(self.index_nodes[p_nb]) for p_nb in np.where(failed_nodes)[0]],'failing_project':project_id}
+			self.results = {'raw':failed_nodes,'ids':self.index_nodes[np.where(failed_nodes)[0]],'failing_project':project_id}
+		else:
+			self.results = {'raw':failed_nodes}
+
+	def run_grid(self,propag_proba_list,full_results=True):
+		'''
+		Runs the crn implementation for several values of propag_proba in one pass.
+		Draws do not depend on propag_proba and cascades are monotone in it: a project fails for a given propag_proba iff its critical threshold (see crn_thresholds) is lower.
+		Returns a list of Simulation objects, one per value of propag_proba, with results set as if run had been called on each of them.
+		'''
+		if self.implementation != 'crn':
+			raise ValueError('Grid runs are only available for the crn implementation, not {}'.format(self.implementation))
+		project_id = self.failing_project
+		project_nb = self.index_reverse[project_id]
+		if self.users_mat[project_nb].nnz == 0: # same convention as run: a project used by no other project yields empty results
+			crit = np.full((len(self.index_nodes),),np.inf)
+		else:
+			crit = self.crn_thresholds(project_nb=project_nb,max_proba=max(propag_proba_list))
+		sim_list = []
+		for propag_proba in propag_proba_list:
+			sim = copy.copy(self)
+			sim.propag_proba = propag_proba
+			sim.sim_cfg = dict(self.sim_cfg,propag_proba=propag_proba)
+			with np.errstate(divide='ignore'):
+				sim.edge_propag_proba = propag_proba/self.out_degree_norm
+			sim.set_results(failed_nodes=(crit < propag_proba),project_id=project_id,full_results=full_results)
+			sim_list.append(sim)
+		return sim_list
+
+	def crn_thresholds(self,project_nb,max_proba=1.):
+		'''
+		Critical values of propag_proba for the crn cascade starting at project_nb: a project fails iff propag_proba is higher than its threshold.
+		The threshold of a project is the minimum over paths from the source of the maximum over the edges of draw*outdegree(project_using)**norm_exponent, computed by label correcting.
+		Thresholds higher than max_proba are not explored and set to inf.
+		'''
+		source = self.index_nodes[project_nb]
+		crit = np.full((len(self.index_nodes),),np.inf)
+		crit[project_nb] = -np.inf
+		frontier = np.asarray([project_nb])
+		while len(frontier):
+			sub = self.users_mat[frontier]
+			users = sub.indices
+			used = np.repeat(frontier,np.diff(sub.indptr))
+			draws = edge_uniforms(random_seed=self.random_seed,source=source,using=self.index_nodes[users],used=self.index_nodes[used])
+			values = np.maximum(crit[used],draws*self.out_degree_norm[users])
+			kept = values < np.minimum(crit[users],max_proba)
+			users = users[kept]
+			previous = crit[users]
+			np.minimum.at(crit,users,values[kept])
+			frontier = np.unique(users[crit[users] < previous])
+		return crit
+
+	def crn_cascade(self,project_nb):
+		'''
+		Cascade for the crn implementation, breadth first: each edge from a failed project to one of its users is tested once, against its draw from edge_uniforms.
+		Returns the boolean vector of failed nodes.
+		'''
+		total_nodes = len(self.index_nodes)
+		source = self.index_nodes[project_nb]
+		failed_nodes = np.zeros((total_nodes,),dtype=bool)
+		failed_nodes[project_nb] = True
+		frontier = np.asarray([project_nb])
+		iteration = 0
+		while len(frontier):
+			iteration += 1
+			sub = self.users_mat[frontier]
+			users = sub.indices
+			used = np.repeat(frontier,np.diff(sub.indptr))
+			draws = edge_uniforms(random_seed=self.random_seed,source=source,using=self.index_nodes[users],used=self.index_nodes[used])
+			fired = users[draws < self.edge_propag_proba[users]]
+			frontier = np.unique(fired[~failed_nodes[fired]])
+			failed_nodes[frontier] = True
+			if self.verbose:
+				logger.info('Iteration {}, new failing {}, total failing {}, total nodes {}'.format(iteration,len(frontier),failed_nodes.sum(),total_nodes))
+		return failed_nodes
 
 	def propagate(self,source_id):
 		'''
@@ -1,4 +1,6 @@
 import datetime
+import itertools
+import numpy as np
 
 
 
@@ -18,3 +20,32 @@ def clean_timestamp(t):
 			raise ValueError('Unknown timestamp format {} : Should be datetime object, or YYYY-MM-DD or YYYY-MM-DD HH:MM:SS'.format(t))
 	else:
 		return t.replace(microsecond=0)
+
+def format_timestamp(t):
+	'''
+	Canonical text form of a timestamp, 'YYYY-MM-DD HH:MM:SS', as stored in SQLite databases.
+	Being sortable as text, it can be compared directly to indexed columns.
+	'''
+	return clean_timestamp(t).strftime('%Y-%m-%d %H:%M:%S')
+
+def rows_to_arrays(rows,nb_cols,dtype=np.int64):
+	'''
+	Decoding query rows (tuples of nb_cols numeric values) into one typed numpy array per column.
+	The values are read in a single pass with np.fromiter, without building intermediate python lists.
+	'''
+	if not isinstance(rows,list):
+		rows = list(rows)
+	flat = np.fromiter(itertools.chain.from_iterable(rows),dtype=dtype,count=len(rows)*nb_cols)
+	flat = flat.reshape((len(rows),nb_cols))
+	return tuple(flat[:,k] for k in range(nb_cols))
+
+def ids_to_indices(id_vec,ids):
+	'''
+	Positions of ids in the sorted vector id_vec, using np.searchsorted.
+	Raises a ValueError if some ids are not in id_vec.
+	'''
+	ids = np.asarray(ids)
+	indices = np.searchsorted(id_vec,ids)
+	if len(ids) and (indices.max() >= len(id_vec) or (id_vec[indices % len(id_vec)] != ids).any()):
+		raise ValueError('Some ids are not present in the id vector')
+	return indices
@@ -10,3 +10,18 @@ def test_import():
 	libname = os.path.basename(dir_name)
 	importlib.import_module(libname)
 
+
+def test_decode_rows():
+	import numpy as np
+	import pytest
+	from depsysif import utils
+	id_vec = np.asarray([2,5,9,14])
+	col_a,col_b = utils.rows_to_arrays([(9,1),(2,3),(14,0)],2)
+	assert list(col_a) == [9,2,14]
+	assert list(col_b) == [1,3,0]
+	assert list(utils.ids_to_indices(id_vec,col_a)) == [2,0,3]
+	assert len(utils.rows_to_arrays([],3)[2]) == 0
+	with pytest.raises(ValueError):
+		utils.ids_to_indices(id_vec,[5,6])
+	with pytest.raises(ValueError):
+		utils.ids_to_indices(id_vec,[15])
@@ -88,6 +88,45 @@ def test_snapshot_getnet(testdb,timestamp,fullnetwork):
 	testdb.build_snapshot(snapshot_time=timestamp,full_network=fullnetwork)
 	testdb.get_network(snapshot_time=timestamp,full_network=fullnetwork)
 
+def test_temporal_snapshot(testdb,timestamp,fullnetwork):
+	for t in [timestamp,'2014-02-04','2014-03-08 12:00:00','2014-04-05']:
+		edges = sorted(testdb.get_network(snapshot_time=t,full_network=fullnetwork,as_nx_obj=False))
+		assert sorted(testdb.get_temporal_edges(snapshot_time=t,full_network=fullnetwork)) == edges
+		testdb.temporal_snapshots = True
+		assert sorted(testdb.get_network(snapshot_time=t,full_network=fullnetwork,as_nx_obj=False)) == edges
+		testdb.temporal_snapshots = False
+
+def test_network_cache(testdb,fullnetwork):
+	snapid = testdb.get_snapshot_id(snapshot_time='2014-03-05',full_network=fullnetwork)
+	net = testdb.get_network(snapshot_id=snapid)
+	assert testdb.network_cache_info()['misses'] == 1
+	assert sorted(testdb.get_network(snapshot_id=snapid).edges()) == sorted(net.edges())
+	assert testdb.get_nodes(snapshot_id=snapid) == sorted(net.nodes())
+	assert testdb.network_cache_info()['hits'] == 2
+	testdb.delete_dependency(4,1)
+	assert testdb.network_cache_info()['size'] == 0
+	testdb.get_network(snapshot_id=snapid)
+	assert testdb.network_cache_info()['misses'] == 2
+
+def test_timestamp_migration(testdb):
+	if testdb.db_type == 'sqlite':
+		testdb.cursor.execute("UPDATE versions SET created_at='2014-02-08T00:00:00.000+00:00' WHERE id=32;")
+		testdb.cursor.execute('PRAGMA user_version=0;')
+		testdb.migrate_timestamps()
+		testdb.cursor.execute('SELECT created_at FROM versions WHERE id=32;')
+		assert testdb.cursor.fetchone()[0] == '2014-02-08 00:00:00'
+		testdb.cursor.execute('EXPLAIN QUERY PLAN SELECT id FROM versions WHERE created_at<=?;',('2014-02-08 00:00:00',))
+		assert 'versions_time' in str(testdb.cursor.fetchall())
+	assert testdb.get_nodes(snapshot_time='2014-01-03') == [1,2,3]
+
+def test_cfg_ids(testdb):
+	cfg = {'propag_proba':0.9,'norm_exponent':0.,'implementation':'matrix'}
+	assert testdb.get_cfg_id({'order':1},create=False) is None
+	cfg_id = testdb.get_cfg_id(cfg)
+	testdb.cfg_ids = {}
+	assert testdb.get_cfg_id(dict(reversed(list(cfg.items())))) == cfg_id
+	assert testdb.get_cfg(cfg_id) == cfg
+	testdb.connection.commit()
 
 
 def test_move_to_ram(dbtype):
@@ -3,6 +3,9 @@ import pytest
 import datetime
 import os
 import time
+import scipy.sparse
+import networkx
+import numpy as np
 
 #### Parameters
 dbtype_list = [
@@ -117,6 +120,62 @@ def test_results_full_aggregated(testdb,timestamp):
 	xp_man.get_results_full(snapshot_id=snapid,result_type='nb_failing',nb_sim=10,aggregated=True)
 
 
+def test_results_consistency(testdb,timestamp):
+	xp_man = depsysif.experiment_manager.ExperimentManager(db=testdb)
+	xp_man.run_simulations(snapshot_time=timestamp,nb_sim=10)
+	snapid = testdb.get_snapshot_id(snapshot_time=timestamp)
+	raw = xp_man.get_results_full(snapshot_id=snapid,result_type='raw',nb_sim=10)
+	counts = xp_man.get_results_full(snapshot_id=snapid,result_type='counts',nb_sim=10)
+	counts_agg = xp_man.get_results_full(snapshot_id=snapid,result_type='counts',nb_sim=10,aggregated=True)
+	nb_failing = xp_man.get_results_full(snapshot_id=snapid,result_type='nb_failing',nb_sim=10)
+	nb_failing_agg = xp_man.get_results_full(snapshot_id=snapid,result_type='nb_failing',nb_sim=10,aggregated=True)
+	assert raw.shape == (counts.shape[0],10*counts.shape[0])
+	assert raw.sum() == pytest.approx(10*counts.sum())
+	assert counts.sum(axis=1).A1 == pytest.approx(counts_agg)
+	assert nb_failing.sum(axis=0).A1/10 == pytest.approx(nb_failing_agg)
+	assert counts.sum(axis=0).A1 == pytest.approx(nb_failing_agg)
+	raw_1 = xp_man.get_results(snapshot_id=snapid,result_type='raw',failing_project=1,nb_sim=10)
+	nb_failing_1 = xp_man.get_results(snapshot_id=snapid,result_type='nb_failing',failing_project=1,nb_sim=10)
+	assert raw_1.sum(axis=0).A1 == pytest.approx(nb_failing_1)
+
+
+def test_results_aggregates(testdb,timestamp):
+	xp_man = depsysif.experiment_manager.ExperimentManager(db=testdb)
+	xp_man.run_simulations(snapshot_time=timestamp,nb_sim=10)
+	snapid = testdb.get_snapshot_id(snapshot_time=timestamp)
+	assert xp_man.aggregates_available(snapshot_id=snapid,nb_sim=10,nb_sources=len(xp_man.get_id_vector(snapshot_id=snapid)))
+	def all_results():
+		return (xp_man.get_results_full(snapshot_id=snapid,result_type='counts',nb_sim=10).toarray(),
+			xp_man.get_results_full(snapshot_id=snapid,result_type='counts',nb_sim=10,aggregated=True),
+			xp_man.get_results_full(snapshot_id=snapid,result_type='nb_failing',nb_sim=10,aggregated=True),
+			xp_man.get_results(snapshot_id=snapid,result_type='counts',failing_project=1,nb_sim=10))
+	from_agg = all_results()
+	testdb.cursor.execute('DELETE FROM sim_agg;')
+	testdb.connection.commit()
+	from_scan = all_results()
+	testdb.rebuild_sim_aggregates()
+	from_rebuilt = all_results()
+	for r_agg,r_scan,r_rebuilt in zip(from_agg,from_scan,from_rebuilt):
+		assert r_agg == pytest.approx(r_scan)
+		assert r_rebuilt == pytest.approx(r_scan)
+
+
+@pytest.mark.parametrize('chunk_size',[None,7,1000])
+def test_iter_results(testdb,timestamp,chunk_size):
+	xp_man = depsysif.experiment_manager.ExperimentManager(db=testdb)
+	xp_man.run_simulations(snapshot_time=timestamp,nb_sim=10)
+	snapid = testdb.get_snapshot_id(snapshot_time=timestamp)
+	raw = xp_man.get_results_full(snapshot_id=snapid,result_type='raw',nb_sim=10)
+	blocks = list(xp_man.iter_results(snapshot_id=snapid,nb_sim=10,chunk_size=chunk_size,fetch_size=3))
+	if chunk_size is None:
+		assert [fp for fp,_ in blocks] == list(xp_man.get_id_vector(snapshot_id=snapid))
+	else:
+		assert [col for col,_ in blocks] == list(range(0,raw.shape[1],chunk_size))
+	streamed = scipy.sparse.hstack([b for _,b in blocks]).tocsr()
+	assert streamed.shape == raw.shape
+	assert (streamed != raw).nnz == 0
+
+
 ### Measures
 def test_measure(testdb,timestamp,measurecfg):
 	xp_man = depsysif.experiment_manager.ExperimentManager(db=testdb)
@@ -124,6 +183,73 @@ def test_measure(testdb,timestamp,measurecfg):
 	snapid = testdb.get_snapshot_id(snapshot_time=timestamp)
 	xp_man.compute_measure(snapshot_id=snapid,**measurecfg)
 
+@pytest.mark.parametrize('order',[1,2,3,0])
+def test_degree_measures(testdb,timestamp,order):
+	xp_man = depsysif.experiment_manager.ExperimentManager(db=testdb)
+	snapid = testdb.get_snapshot_id(snapshot_time=timestamp)
+	net = testdb.get_network(snapshot_id=snapid)
+	for measure,graph in [('in_degree',net.reverse()),('out_degree',net)]:
+		value_vec,projid_vec = getattr(depsysif.measures,measure)(snapshot_id=snapid,xp_man=xp_man,order=order)
+		for v,p in zip(value_vec,projid_vec):
+			if order == 0:
+				expected = len(networkx.descendants(graph,p))
+			else:
+				expected = len(networkx.single_source_shortest_path_length(graph,p,cutoff=order))-1
+			assert v == expected
+	adj,nodes = depsysif.measures.adjacency_matrix(snapshot_id=snapid,xp_man=xp_man)
+	assert list(depsysif.measures.transitive_counts(adj,max_block_bytes=1)) == list(depsysif.measures.transitive_counts(adj))
+	xp_man.compute_measure(snapshot_id=snapid,measure='in_degree',order=order)
+
+
+@pytest.mark.parametrize('measure',['failure_proba','causing_failure_proba'])
+def test_failure_proba_measures(testdb,timestamp,measure):
+	xp_man = depsysif.experiment_manager.ExperimentManager(db=testdb)
+	xp_man.run_simulations(snapshot_time=timestamp,nb_sim=10,propag_proba=1.)
+	snapid = testdb.get_snapshot_id(snapshot_time=timestamp)
+	simulated,id_vec = getattr(depsysif.measures,measure)(snapshot_id=snapid,xp_man=xp_man,nb_sim=10,propag_proba=1.)
+	computed,id_vec_computed = getattr(depsysif.measures,'computed_'+measure)(snapshot_id=snapid,xp_man=xp_man,propag_proba=1.)
+	assert list(id_vec) == list(id_vec_computed)
+	assert simulated == pytest.approx(computed)
+	xp_man.compute_measure(snapshot_id=snapid,measure=measure,nb_sim=10,propag_proba=1.)
+	xp_man.compute_measure(snapshot_id=snapid,measure='computed_'+measure,propag_proba=1.)
+	assert testdb.check_measure(snapshot_id=snapid,measure='computed_'+measure,**depsysif.measures.complete_cfg_computed_failure_proba(propag_proba=1.))
+
+
+@pytest.mark.parametrize('measure',['in_degree','out_degree'])
+def test_measure_parallel(testdb,measure):
+	xp_man = depsysif.experiment_manager.ExperimentManager(db=testdb)
+	snapids = [testdb.get_snapshot_id(snapshot_time=t) for t in ['2014-02-05 00:11:22','2015-02-05 00:00:00','2016-02-05 00:00:00']]
+	xp_man.compute_measure(snapshot_id=snapids[0],measure=measure)
+	xp_man.compute_measure(measure=measure,workers=2)
+	for snapid in snapids:
+		assert testdb.check_measure(measure=measure,snapshot_id=snapid,order=1)
+		expected,projid_vec = getattr(depsysif.measures,measure)(snapshot_id=snapid,xp_man=xp_man)
+		for val,p_id in zip(expected,projid_vec):
+			if testdb.db_type == 'postgres':
+				testdb.cursor.execute('SELECT m.value FROM measures m INNER JOIN measure_types mt ON mt.id=m.measure_id AND mt.name=%s AND m.snapshot_id=%s AND m.project_id=%s;',(measure,snapid,int(p_id)))
+			else:
+				testdb.cursor.execute('SELECT m.value FROM measures m INNER JOIN measure_types mt ON mt.id=m.measure_id AND mt.name=? AND m.snapshot_id=? AND m.project_id=?;',(measure,snapid,int(p_id)))
+			assert testdb.cursor.fetchone()[0] == val
+
+
+def test_compute_measures(testdb,timestamp):
+	xp_man = depsysif.experiment_manager.ExperimentManager(db=testdb)
+	xp_man.run_simulations(snapshot_time=timestamp,nb_sim=10)
+	snapid = testdb.get_snapshot_id(snapshot_time=timestamp)
+	measure_list = ['mean_cascade_length','in_degree','causing_failure_proba',('out_degree',{'order':2}),'failure_proba']
+	bootstrap_dict = {}
+	xp_man.compute_measures(measure_list,snapshot_id=snapid,bootstrap_dict=bootstrap_dict,nb_sim=10)
+	assert len([k for k in bootstrap_dict.keys() if k[0] == 'results']) == 2 # counts matrix, and aggregated nb_failing derived from it
+	expected = depsysif.measures.mean_cascade_length(snapshot_id=snapid,xp_man=xp_man,nb_sim=10)[0]
+	cascade_key = [k for k in bootstrap_dict.keys() if k[0] == 'results' and k[3] == 'nb_failing'][0]
+	assert bootstrap_dict[cascade_key] == pytest.approx(expected)
+	assert testdb.check_measure(measure='mean_cascade_length',snapshot_id=snapid,**depsysif.measures.complete_cfg_mean_cascade_length(nb_sim=10))
+	assert testdb.check_measure(measure='failure_proba',snapshot_id=snapid,**depsysif.measures.complete_cfg_failure_proba(nb_sim=10))
+	assert testdb.check_measure(measure='in_degree',snapshot_id=snapid,order=1)
+	assert testdb.check_measure(measure='out_degree',snapshot_id=snapid,order=2)
+	xp_man.compute_measures(measure_list,nb_sim=10)
+
+
 #### Proba exact
 
 def test_excomp(testdb,timestamp,proba_implementation):
@@ -131,3 +257,105 @@ def test_excomp(testdb,timestamp,proba_implementation):
 	xp_man.run_simulations(snapshot_time=timestamp,nb_sim=10)
 	snapid = testdb.get_snapshot_id(snapshot_time=timestamp)
 	xp_man.compute_exact_proba(snapshot_id=snapid,proba_implementation=proba_implementation)
+
+def test_bulk_writers(testdb):
+	xp_man = depsysif.experiment_manager.ExperimentManager(db=testdb)
+	snapids = [testdb.get_snapshot_id(snapshot_time=t) for t in ['2014-02-05 00:11:22','2015-02-05 00:00:00']]
+	id_vec = xp_man.get_id_vector(snapshot_id=snapids[0])
+	testdb.fill_measures_bulk(measure='in_degree',measure_data=[(snapid,np.arange(len(id_vec))*0.5,id_vec) for snapid in snapids],order=5)
+	testdb.fill_measures_bulk(measure='in_degree',measure_data=[(snapids[0],np.ones(len(id_vec)),id_vec)],order=5) # already filled in, skipped
+	for snapid in snapids:
+		assert testdb.check_measure(measure='in_degree',snapshot_id=snapid,order=5)
+	testdb.cursor.execute('SELECT project_id,value FROM measures ORDER BY snapshot_id,project_id;')
+	assert [tuple(r) for r in testdb.cursor.fetchall()] == [(int(p),0.5*i) for _ in snapids for i,p in enumerate(id_vec)]
+
+	value_mat = np.zeros((2,len(id_vec)))
+	value_mat[0,0] = 0.25
+	value_mat[1,2] = 1.
+	testdb.fill_exact_comp_bulk(snapshot_id=snapids[0],source_ids=id_vec[:2],value_mat=value_mat,projid_vec=id_vec,proba_implementation='test')
+	testdb.fill_exact_comp_bulk(snapshot_id=snapids[1],source_ids=id_vec[:2],value_mat=scipy.sparse.csr_matrix(value_mat),projid_vec=id_vec,proba_implementation='test')
+	testdb.cursor.execute('SELECT ec.snapshot_id,source_id,target_id,proba_value FROM exact_computation_values ecv INNER JOIN exact_computation ec ON ec.id=ecv.exact_comp_id ORDER BY ec.snapshot_id,source_id;')
+	expected = []
+	for snapid in snapids:
+		expected += [(snapid,int(id_vec[0]),int(id_vec[0]),0.25),(snapid,int(id_vec[1]),int(id_vec[2]),1.)]
+	assert [tuple(r) for r in testdb.cursor.fetchall()] == expected
+
+def test_measure_matrix(testdb,tmp_path):
+	xp_man = depsysif.experiment_manager.ExperimentManager(db=testdb)
+	snapids = [testdb.get_snapshot_id(snapshot_time=t) for t in ['2016-02-05 00:00:00','2014-02-05 00:11:22','2015-02-05 00:00:00']]
+	xp_man.compute_measure(measure='in_degree',snapshot_id=snapids[1])
+	matrix,project_ids,snapshot_times = xp_man.get_measure_matrix(measure='in_degree')
+	assert matrix.shape == (len(project_ids),1)
+	xp_man.compute_measure(measure='in_degree')
+	matrix,project_ids,snapshot_times = xp_man.get_measure_matrix(measure='in_degree')
+	assert matrix.shape == (len(project_ids),3)
+	assert snapshot_times == sorted(snapshot_times)
+	for j,snapid in enumerate([snapids[1],snapids[2],snapids[0]]):
+		value_vec,projid_vec = depsysif.measures.in_degree(snapshot_id=snapid,xp_man=xp_man)
+		for val,p_id in zip(value_vec,projid_vec):
+			assert matrix[list(project_ids).index(p_id),j] == val
+	values,_,_ = xp_man.get_measure_matrix(measure='in_degree',project_ids=[project_ids[1],-1])
+	assert list(values[0]) == list(matrix[1])
+	assert np.isnan(values[1]).all()
+	project_names = [testdb.get_project_name(project_id=p_id) for p_id in project_ids]
+	fig = xp_man.plot_measure(measure='in_degree',project_names=project_names,filename=str(tmp_path/'in_degree.png'))
+	assert len(fig.axes[0].lines) == len(project_names)
+	assert os.path.exists(str(tmp_path/'in_degree.png'))
+
+def test_simulations_series(testdb,monkeypatch):
+	xp_man = depsysif.experiment_manager.ExperimentManager(db=testdb)
+	snapids = [testdb.get_snapshot_id(snapshot_time=t) for t in ['2014-02-10 00:00:00','2014-03-10 00:00:00','2014-04-10 00:00:00','2014-05-10 00:00:00']]
+	nb_runs = []
+	run = depsysif.simulations.Simulation.run
+	def counting_run(sim,*args,**kwargs):
+		nb_runs.append(sim.snapshot_id)
+		return run(sim,*args,**kwargs)
+	monkeypatch.setattr(depsysif.simulations.Simulation,'run',counting_run)
+	xp_man.run_simulations_series(snapshot_ids=snapids,nb_sim=5,propag_proba=0.5,norm_exponent=1)
+	assert nb_runs.count(snapids[-1]) == 0 # no change in the network after the last versions
+	assert len(nb_runs) < 5*sum(len(testdb.get_nodes(snapshot_id=snapid)) for snapid in snapids)
+
+	for snapid in snapids:
+		network = testdb.get_network(snapshot_id=snapid)
+		for p_id in testdb.get_nodes(snapshot_id=snapid):
+			for seed in range(5):
+				sim = depsysif.simulations.Simulation(network=network,failing_project=p_id,random_seed=seed,propag_proba=0.5,norm_exponent=1,implementation='crn')
+				run(sim)
+				expected = sorted(sim.index_nodes[sim.results['raw']].tolist())
+				if testdb.db_type == 'postgres':
+					testdb.cursor.execute('''SELECT sr.failing FROM simulations s INNER JOIN simulation_results sr ON sr.simulation_id=s.id
+						WHERE s.snapshot_id=%s AND s.failing_project=%s AND s.random_seed=%s ORDER BY sr.failing;''',(snapid,p_id,seed))
+				else:
+					testdb.cursor.execute('''SELECT sr.failing FROM simulations s INNER JOIN simulation_results sr ON sr.simulation_id=s.id
+						WHERE s.snapshot_id=? AND s.failing_project=? AND s.random_seed=? ORDER BY sr.failing;''',(snapid,p_id,seed))
+				assert [r[0] for r in testdb.cursor.fetchall()] == expected
+	# aggregates are copied along with the results
+	results = [xp_man.get_results(snapshot_id=snapid,nb_sim=5,propag_proba=0.5,norm_exponent=1,implementation='crn').toarray() for snapid in snapids[-2:]]
+	assert (results[0] == results[1]).all()
+	testdb.connection.commit()
+
+@pytest.mark.parametrize('norm_exponent',[0,1])
+def test_simulations_grid(testdb,timestamp,norm_exponent):
+	xp_man = depsysif.experiment_manager.ExperimentManager(db=testdb)
+	grid = [0.1,0.3,0.5,0.7,0.9]
+	xp_man.run_simulations_grid(propag_proba_list=grid[::2],snapshot_time=timestamp,nb_sim=10,norm_exponent=norm_exponent)
+	xp_man.run_simulations_grid(propag_proba_list=grid,snapshot_time=timestamp,nb_sim=10,norm_exponent=norm_exponent)
+	snapid = testdb.get_snapshot_id(snapshot_time=timestamp)
+	network = testdb.get_network(snapshot_id=snapid)
+	nodes = testdb.get_nodes(snapshot_id=snapid)
+	for propag_proba in grid:
+		sim_cfg = {'propag_proba':propag_proba,'norm_exponent':norm_exponent,'implementation':'crn'}
+		seeds = xp_man.executed_seeds(snapshot_id=snapid,sim_cfg_id=testdb.get_cfg_id(sim_cfg))
+		assert seeds == {p_id:set(range(10)) for p_id in nodes}
+		for p_id in nodes:
+			for seed in range(10):
+				sim = depsysif.simulations.Simulation(network=network,failing_project=p_id,random_seed=seed,**sim_cfg)
+				sim.run()
+				if testdb.db_type == 'postgres':
+					testdb.cursor.execute('''SELECT sr.failing FROM simulations s INNER JOIN simulation_results sr ON sr.simulation_id=s.id
+						WHERE s.snapshot_id=%s AND s.sim_cfg_id=%s AND s.failing_project=%s AND s.random_seed=%s ORDER BY sr.failing;''',(snapid,testdb.get_cfg_id(sim_cfg),p_id,seed))
+				else:
+					testdb.cursor.execute('''SELECT sr.failing FROM simulations s INNER JOIN simulation_results sr ON sr.simulation_id=s.id
+						WHERE s.snapshot_id=? AND s.sim_cfg_id=? AND s.failing_project=? AND s.random_seed=? ORDER BY sr.failing;''',(snapid,testdb.get_cfg_id(sim_cfg),p_id,seed))
+				assert [r[0] for r in testdb.cursor.fetchall()] == sorted(sim.results['ids'].tolist())
+	testdb.connection.commit()